@@ -0,0 +1,298 @@
+"""Benchmarks for opening, saving and changing levels.
+
+Levels are generated from a seed, so every run measures the same levels:
+
+    python3 benchmarks/bench.py --output results.json
+    python3 benchmarks/bench.py --baseline results.json
+
+Comparing against a baseline exits with 1 if anything got slower than the
+allowed ratio."""
+
+import argparse, json, os, platform, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from cell_machine_levels import level
+
+SIZES = [16, 128, 512]
+QUICK_SIZES = [16, 64]
+DENSITIES = [0.05, 0.5]
+PATTERNS = ["random", "tiles", "stripes"]
+FORMATS = ["V1", "V2", "V3"]
+# Random boards of 2 cells have many short matches everywhere, saving them
+# should take the same time per cell at every size
+SCALING_SIZES = [100, 200, 400]
+QUICK_SCALING_SIZES = [50, 100]
+
+
+def generate_level(
+    width: int, height: int, density: float, pattern: str, seed: int = 0
+) -> level.Level:
+    """Generate a level.
+
+    Args:
+        width (int): The width of the level.
+        height (int): The height of the level.
+        density (float): How many of the cells aren't bg, from 0 to 1.
+        pattern (str): How the cells repeat, "random" doesn't repeat, "tiles"
+            repeats a random 8 by 8 tile, "stripes" repeats a random row and
+            "binary" doesn't repeat but only uses 2 cells.
+        seed (int): The seed of the random cells.
+
+    Returns:
+        level.Level: The level."""
+    rng = random.Random(f"{width} {height} {density} {pattern} {seed}")
+
+    def random_codes(amount: int) -> list:
+        return [
+            rng.randrange(72) if rng.random() < density else 72 + rng.randrange(2)
+            for _ in range(amount)
+        ]
+
+    if pattern == "random":
+        codes = random_codes(width * height)
+    elif pattern == "binary":
+        cells = random_codes(2)
+        codes = [rng.choice(cells) for _ in range(width * height)]
+    elif pattern == "tiles":
+        tile = random_codes(64)
+        codes = [tile[y % 8 * 8 + x % 8] for y in range(height) for x in range(width)]
+    elif pattern == "stripes":
+        row = random_codes(width)
+        codes = row * height
+    else:
+        raise ValueError(f"The pattern {pattern} doesn't exist.")
+
+    return level.Level.from_codes(
+        width, height, bytes(codes), "", f"bench_{pattern}", rng.randrange(4)
+    )
+
+
+def measure(function, min_time: float) -> float:
+    """Time a function, running it until min_time has passed.
+
+    Args:
+        function: The function to run.
+        min_time (float): The least amount of seconds to spend running it.
+
+    Returns:
+        float: The fastest run in seconds."""
+    best = float("inf")
+    start = time.perf_counter()
+    while True:
+        run_start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - run_start)
+        if time.perf_counter() - start >= min_time:
+            return best
+
+
+def peak_memory(function) -> int:
+    """Get the peak memory a function allocates.
+
+    Args:
+        function: The function to run.
+
+    Returns:
+        int: The peak amount of bytes allocated while running it."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def operations(test: level.Level) -> dict:
+    """Get the operations to benchmark on a level.
+
+    Args:
+        test (level.Level): The level.
+
+    Returns:
+        dict: The operations by name."""
+    result = {}
+    for format in FORMATS:
+        level_code = test.save(format)
+        result[f"open {format}"] = lambda level_code=level_code: level.open(level_code)
+        # Clones don't have the saves of the level, so everything is encoded
+        result[f"save {format}"] = lambda format=format: test.clone().save(format)
+
+    # Only the end of a level that was saved before is encoded again
+    resaved = test.clone()
+    resaved.track_saves = True
+    resaved.save("V3")
+    result["resave V3"] = lambda: resave(resaved, "V3")
+
+    result["clone"] = test.clone
+    result["optimize"] = lambda: test.clone().optimize()
+    result["iterate"] = lambda: [None for _ in test]
+    return result
+
+
+def resave(test: level.Level, format: str) -> str:
+    """Change the last cell of a level and save it again.
+
+    Args:
+        test (level.Level): The level, saved in the format before.
+        format (str): The format to save in.
+
+    Returns:
+        str: The level code."""
+    if test[-1, -1, False].type == level.CellEnum.bg:
+        test[-1, -1] = level.Cell(level.CellEnum.mover, level.Rotation.up)
+    else:
+        test[-1, -1] = level.Cell()
+    return test.save(format)
+
+
+def run(sizes: list, scaling_sizes: list, min_time: float) -> list:
+    """Run every benchmark.
+
+    Args:
+        sizes (list): The widths and heights of the levels.
+        scaling_sizes (list): The widths and heights of the levels to check
+            that saving scales linearly on.
+        min_time (float): The least amount of seconds to time everything for.
+
+    Returns:
+        list: A result for every level and operation."""
+    results = []
+    for size in sizes:
+        for density in DENSITIES:
+            for pattern in PATTERNS:
+                test = generate_level(size, size, density, pattern)
+                case = f"{size}x{size} {density} {pattern}"
+
+                for name, function in operations(test).items():
+                    seconds = measure(function, min_time)
+                    results.append(
+                        {
+                            "case": case,
+                            "operation": name,
+                            "seconds": seconds,
+                            "cells_per_second": size * size / seconds,
+                            "codes_per_second": 1 / seconds,
+                            "peak_bytes": peak_memory(function),
+                        }
+                    )
+                    print(
+                        f"{case:24} {name:10} {seconds * 1000:10.3f} ms "
+                        f"{size * size / seconds / 1e6:8.2f} Mcells/s "
+                        f"{results[-1]['peak_bytes'] / 1024:10.1f} KiB",
+                        flush=True,
+                    )
+
+    # The time per cell shouldn't grow with the size of the level
+    previous = None
+    for size in scaling_sizes:
+        test = generate_level(size, size, 1, "binary")
+        function = lambda test=test: test.clone().save("V3")
+        seconds = measure(function, min_time)
+        results.append(
+            {
+                "case": f"{size}x{size} binary",
+                "operation": "save V3",
+                "seconds": seconds,
+                "cells_per_second": size * size / seconds,
+                "codes_per_second": 1 / seconds,
+                "peak_bytes": peak_memory(function),
+            }
+        )
+        cells_per_second = results[-1]["cells_per_second"]
+        growth = (
+            ""
+            if previous is None
+            else f"{previous / cells_per_second:6.2f}x time per cell"
+        )
+        print(
+            f"{results[-1]['case']:24} {'save V3':10} {seconds * 1000:10.3f} ms "
+            f"{cells_per_second / 1e6:8.2f} Mcells/s {growth}",
+            flush=True,
+        )
+        previous = cells_per_second
+    return results
+
+
+def compare(results: list, baseline: list, max_ratio: float) -> bool:
+    """Compare results against a baseline and print the differences.
+
+    Args:
+        results (list): The new results.
+        baseline (list): The baseline results.
+        max_ratio (float): How many times slower a result can be.
+
+    Returns:
+        bool: If nothing got slower than max_ratio."""
+    old = {(result["case"], result["operation"]): result for result in baseline}
+
+    passed = True
+    for result in results:
+        key = (result["case"], result["operation"])
+        if key not in old:
+            continue
+
+        ratio = result["seconds"] / old[key]["seconds"]
+        slower = ratio > max_ratio
+        passed = passed and not slower
+        print(
+            f"{key[0]:24} {key[1]:10} {ratio:6.2f}x time "
+            f"{result['peak_bytes'] / max(old[key]['peak_bytes'], 1):6.2f}x memory"
+            + (" SLOWER" if slower else "")
+        )
+    return passed
+
+
+def main(argv: list = None) -> int:
+    """Run the benchmarks from the command line.
+
+    Args:
+        argv (list): The arguments, sys.argv[1:] by default.
+
+    Returns:
+        int: The exit code."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="file to save the results to as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=1.25,
+        help="how many times slower than the baseline is allowed (default: 1.25)",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="least seconds to time every operation for (default: 0.2)",
+    )
+    parser.add_argument("--quick", action="store_true", help="only small levels")
+    args = parser.parse_args(argv)
+
+    results = run(
+        QUICK_SIZES if args.quick else SIZES,
+        QUICK_SCALING_SIZES if args.quick else SCALING_SIZES,
+        args.min_time,
+    )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                file,
+                indent=4,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        if not compare(results, baseline, args.max_ratio):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,60 +1,207 @@
 """The level parser for V1 levels."""
 
 import re
-from typing import Tuple
-from .level import Level, Cell, CellEnum
+from typing import Dict, Iterator, List, Optional, Tuple
+from . import instrument
+from .level import Cell, CellEnum, DecodedLevel, Level
 from .level import LevelParsingError, LevelTooBigError
 
+# The level code is tokenized a field at a time, without going back
+_HEAD = re.compile(r"V1;(\d+);(\d+);")
+_PLACEABLE = re.compile(r"(\d+)\.(\d+)")
+_CELL = re.compile(r"([0-8])\.([0-3])\.(\d+)\.(\d+)")
+_TAIL = re.compile(r"([\w\d]*);([0-3]?)")
+# Matches every cell that isn't an empty bg in cell codes
+_OCCUPIED = re.compile(rb"[^\x48]")
 
-def open(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> Level:
+# Levels with at least this many cells, of which less than 1 in
+# _SPARSE_RATIO are filled, use the sparse backend unless asked otherwise
+_SPARSE_AREA = 1 << 16
+_SPARSE_RATIO = 16
+
+
+def _error(message: str, position: int) -> LevelParsingError:
+    return LevelParsingError(
+        f"Invalid V1 level code, {message} at position {position}.", position
+    )
+
+
+def _tokens(
+    level_code: str, token: re.Pattern, start: int, end: int
+) -> Iterator[re.Match]:
+    # Tokens separated by commas from start up to end
+    position = start
+    while position < end:
+        match = token.match(level_code, position, end)
+        if match is None:
+            raise _error(f"unexpected {level_code[position]!r}", position)
+        yield match
+
+        position = match.end()
+        if position < end:
+            if level_code[position] != "," or position + 1 == end:
+                raise _error(f"unexpected {level_code[position]!r}", position)
+            position += 1
+
+
+def _parse(level_code: str, max_size: Tuple[int, int]) -> tuple:
+    # The size, placeable indexes, cell codes by index, name and wall effect
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V1 decode")
+
+    head = _HEAD.match(level_code)
+    if head is None:
+        raise LevelParsingError("Invalid V1 level code.", 0)
+    width, height = int(head[1]), int(head[2])
+
+    placeable_start = head.end()
+    cells_start = level_code.find(";", placeable_start) + 1
+    tail_start = level_code.find(";", cells_start) + 1
+    if cells_start == 0 or tail_start == 0:
+        raise _error("missing fields", len(level_code))
+    tail = _TAIL.fullmatch(level_code, tail_start)
+    if tail is None:
+        raise _error("invalid name or wall effect", tail_start)
+
+    if max_size[0] > 0 or max_size[1] > 0:
+        if width > max_size[0] or height > max_size[1]:
+            raise LevelTooBigError(
+                f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
+            )
+
+    if profile is not None:
+        timer("validate")
+
+    # The cells in the level code, later cells replace earlier ones
+    places = []
+    cells = {}
+
+    for match in _tokens(level_code, _PLACEABLE, placeable_start, cells_start - 1):
+        x, y = int(match[1]), int(match[2])
+        if x >= width or y >= height:
+            raise _error("the cell is outside of the level", match.start())
+        places.append(y * width + x)
+
+    for match in _tokens(level_code, _CELL, cells_start, tail_start - 1):
+        x, y = int(match[3]), int(match[4])
+        if x >= width or y >= height:
+            raise _error("the cell is outside of the level", match.start())
+        cells[y * width + x] = int(match[1]) * 2 + int(match[2]) * 18
+
+    if profile is not None:
+        timer("cells")
+        profile.count("bytes in", len(level_code))
+        profile.count("cells decoded", width * height)
+
+    wall_effect = int(tail[2]) if tail[2] != "" else 0
+    return width, height, places, cells, tail[1], wall_effect
+
+
+def open(
+    level_code: str, max_size: Tuple[int, int] = (0, 0), backend: str = None
+) -> Level:
     """Use level.open, that's how to open a level."""
-    if re.match(
-        r"^V1;\d+;\d+;(\d.\d)?(,\d\.\d)*;([0-8]\.[0-3]\.\d+\.\d+)?(,[0-8]\.[0-3]\.\d+\.\d+)*;[\w\d]*;[0-3]?$",
-        level_code,
-    ):
-        level_list = level_code.split(";")
+    width, height, places, cells, name, wall_effect = _parse(level_code, max_size)
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V1 open")
 
-        width, height = int(level_list[1]), int(level_list[2])
+    if backend is None:
+        # Big levels that are mostly empty are kept sparse
+        area = width * height
+        filled = len(places) + len(cells)
+        sparse = area >= _SPARSE_AREA and filled * _SPARSE_RATIO < area
+        backend = "sparse" if sparse else "list"
 
-        if max_size[0] > 0 or max_size[1] > 0:
-            if width > max_size[0] or height > max_size[1]:
-                raise LevelTooBigError(
-                    f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
-                )
+    if backend == "sparse":
+        level = Level(width, height, "", name, wall_effect, backend)
+        for index in places:
+            level[index % width, index // width] = True
+        for index, code in cells.items():
+            level[index % width, index // width] = Cell.from_code(code)
+    else:
+        codes = _codes(width, height, places, cells)
+        level = Level.from_codes(width, height, codes, "", name, wall_effect, backend)
 
-        level = Level(
-            width,
-            height,
-            level_list[5],
-            "",
-            int(level_list[6]) if level_list[6] != "" else 0,
-        )
+    if profile is not None:
+        timer("grid")
+    return level
 
-        # Loop through all the placeable cells and set them to True
-        for i in level_list[3].split(","):
-            x, y = i.split(".")
-            level[int(x), int(y)] = True
 
-        # Loop through all the cells and set them
-        for i in level_list[4].split(","):
-            type, rotation, x, y = i.split(".")
-            level[int(x), int(y)] = Cell(int(type), int(rotation))
+def decode(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> DecodedLevel:
+    """Use level.transcode, that's how to convert a level code."""
+    width, height, places, cells, name, wall_effect = _parse(level_code, max_size)
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V1 decode")
+    codes = _codes(width, height, places, cells)
+    if profile is not None:
+        timer("codes")
+    return DecodedLevel(width, height, codes, "", name, wall_effect)
 
-        return level
 
-    raise LevelParsingError("Invalid V1 level code.")
+def _codes(width: int, height: int, places: List[int], cells: Dict[int, int]):
+    # Every cell starts as a bg that isn't placeable
+    codes = bytearray(b"\x48") * (width * height)
+    for index, code in cells.items():
+        codes[index] = code
+    for index in places:
+        codes[index] |= 1
+    return codes
 
 
 def save(level: Level) -> str:
     """Use level.Level.save, that's how to save a level."""
+    profile = instrument.active
+    timer = profile.timer("V1 encode") if profile is not None else None
+
     # Loop through the level and save it to 2 lists which are used in the V1 level code
     placeable = []
     cells = []
-    for x, y, cell, place in level:
+    for x, y, cell, place in level.occupied():
         if place:
             placeable.append(f"{x}.{y}")
 
         if cell.type != CellEnum.bg:
             cells.append(f"{int(cell.type)}.{int(cell.rotation)}.{x}.{y}")
 
-    return f"V1;{level.width};{level.height};{','.join(placeable)};{','.join(cells)};{level.tutorial_text};{int(level.wall_effect)}"
+    return _assemble(level, placeable, cells, profile, timer)
+
+
+def encode(level: DecodedLevel) -> str:
+    """Use level.transcode, that's how to convert a level code."""
+    profile = instrument.active
+    timer = profile.timer("V1 encode") if profile is not None else None
+
+    # Only the cells that aren't empty bgs are in V1 level codes
+    placeable = []
+    cells = []
+    for match in _OCCUPIED.finditer(level.codes):
+        index = match.start()
+        code = level.codes[index]
+        x, y = index % level.width, index // level.width
+        if code % 2 == 1:
+            placeable.append(f"{x}.{y}")
+
+        if code < 72:
+            cells.append(f"{code // 2 % 9}.{code // 18}.{x}.{y}")
+
+    return _assemble(level, placeable, cells, profile, timer)
+
+
+def _assemble(
+    level: DecodedLevel,
+    placeable: List[str],
+    cells: List[str],
+    profile: Optional[instrument.Profile],
+    timer: Optional[instrument.Timer],
+) -> str:
+    if profile is not None:
+        timer("cells")
+    level_code = f"V1;{level.width};{level.height};{','.join(placeable)};{','.join(cells)};{level.name};{int(level.wall_effect)}"
+    if profile is not None:
+        timer("assemble")
+        profile.count("bytes out", len(level_code))
+        profile.count("cells encoded", level.width * level.height)
+    return level_code
@@ -1,73 +1,137 @@
 """The level parser for V2 levels."""
 
-import re
+import bisect, re
 from typing import Tuple
-from .level import Level, Cell, CellEnum
+from . import instrument
+from .level import DecodedLevel, Level
 from .level import LevelParsingError, LevelTooBigError
-from .base74 import b74_decode, b74_encode
+from .base74 import b74_decode, b74_decode_digits, b74_encode, b74_encode_digits
 
+_B74 = r"[0-9a-zA-Z!$%&+\-.=?^{}]"
 
-def open(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> Level:
+# The level code is tokenized a field at a time, without going back
+_HEAD = re.compile(rf"V2;({_B74}+);({_B74}+);")
+# Cells, the last one can be repeated with )repeat or (repeat)
+_CELLS = re.compile(rf"({_B74}+)(?:\)({_B74})|\(({_B74}+)\))?")
+_TAIL = re.compile(r"([\w\d]*);([\w\d]*);([0-3]?)")
+# A run of the same character when saving
+_RUN = re.compile(r"(.)\1*")
+
+
+def _error(message: str, position: int) -> LevelParsingError:
+    return LevelParsingError(
+        f"Invalid V2 level code, {message} at position {position}.", position
+    )
+
+
+def open(
+    level_code: str, max_size: Tuple[int, int] = (0, 0), backend: str = None
+) -> Level:
     """Use level.open, that's how to open a level."""
-    if re.match(
-        r"^V2;[\da-zA-Z!$%&+-.=?^{}]+;[\da-zA-Z!$%&+-.=?^{}]+;[\da-zA-Z!$%&+-.=?^{}()]*;[\w\d]*;[\w\d]*;[0-3]?$",
-        level_code,
-    ):
-        level_list = level_code.split(";")
-
-        width, height = b74_decode(level_list[1]), b74_decode(level_list[2])
-
-        if max_size[0] > 0 or max_size[1] > 0:
-            if width > max_size[0] or height > max_size[1]:
-                raise LevelTooBigError(
-                    f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
-                )
-
-        level = Level(
-            width,
-            height,
-            level_list[4],
-            level_list[5],
-            int(level_list[6]) if level_list[6] != "" else 0,
-        )
-
-        if level_list[3] == "":
-            return level
-
-        level_list[3] += "0"  # To not error when checking for ) or (
-
-        count = pos = 0
-        while count < len(level_list[3]) - 1:
-            if level_list[3][count + 1] == ")":
-                repeat = b74_decode(level_list[3][count + 2]) + 1
-                count_add = 3
-            elif level_list[3][count + 1] == "(":
-                repeat = b74_decode(level_list[3][count + 2 :].split(")")[0]) + 1
-                count_add = 3 + len(level_list[3][count + 2 :].split(")")[0])
-            else:
-                repeat = 1
-                count_add = 1
-
-            cell_num = b74_decode(level_list[3][count])
-            for i in range(repeat):
-                if cell_num > 71:
-                    level[(pos + i) % width, (pos + i) // height] = cell_num % 2 == 1
-                else:
-                    level[(pos + i) % width, (pos + i) // height] = (
-                        Cell(cell_num // 2 % 9, cell_num // 18 % 4),
-                        cell_num % 2 == 1,
-                    )
-
-            count += count_add
-            pos += repeat
-
-        return level
-
-    raise LevelParsingError("Invalid V2 level code.")
+    decoded = decode(level_code, max_size)
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V2 open")
+    level = Level.from_codes(*decoded, backend)
+    if profile is not None:
+        timer("grid")
+    return level
+
+
+def decode(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> DecodedLevel:
+    """Use level.transcode, that's how to convert a level code."""
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V2 decode")
+
+    head = _HEAD.match(level_code)
+    if head is None:
+        raise LevelParsingError("Invalid V2 level code.", 0)
+    width, height = b74_decode(head[1]), b74_decode(head[2])
+
+    data_start = head.end()
+    data_end = level_code.find(";", data_start)
+    if data_end == -1:
+        raise _error("missing fields", len(level_code))
+    tail = _TAIL.fullmatch(level_code, data_end + 1)
+    if tail is None:
+        raise _error("invalid tutorial text, name or wall effect", data_end + 1)
+
+    if max_size[0] > 0 or max_size[1] > 0:
+        if width > max_size[0] or height > max_size[1]:
+            raise LevelTooBigError(
+                f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
+            )
+
+    if profile is not None:
+        timer("validate")
+
+    # Every cell starts as a bg that isn't placeable
+    codes = bytearray(b"\x48") * (width * height)
+    codes_index = 0
+
+    position = data_start
+    while position < data_end:
+        match = _CELLS.match(level_code, position, data_end)
+        if match is None:
+            raise _error(f"unexpected {level_code[position]!r}", position)
+        cells, short_repeat, long_repeat = match.groups()
+        cells = b74_decode_digits(cells)
+
+        repeat = 1
+        if short_repeat is not None:
+            repeat = b74_decode(short_repeat) + 1
+        elif long_repeat is not None:
+            repeat = b74_decode(long_repeat) + 1
+
+        if codes_index + len(cells) - 1 + repeat > len(codes):
+            raise _error("more cells than the level has", position)
+        codes[codes_index : codes_index + len(cells) - 1] = cells[:-1]
+        codes_index += len(cells) - 1
+        codes[codes_index : codes_index + repeat] = cells[-1:] * repeat
+        codes_index += repeat
+        position = match.end()
+
+    if profile is not None:
+        timer("runs")
+        profile.count("bytes in", len(level_code))
+        profile.count("cells decoded", width * height)
+        # Every repeat has a single )
+        profile.count("repeats decoded", level_code.count(")", data_start, data_end))
+
+    return DecodedLevel(
+        width,
+        height,
+        codes,
+        tail[1],
+        tail[2],
+        int(tail[3]) if tail[3] != "" else 0,
+    )
 
 
 def save(level: Level) -> str:
     """Use level.Level.save, that's how to save a level."""
+    return encode(DecodedLevel.from_level(level))
+
+
+def encode(level: DecodedLevel) -> str:
+    """Use level.transcode, that's how to convert a level code."""
+    return reencode(level, 0, None)[0]
+
+
+def reencode(level: DecodedLevel, start: int, state: object) -> Tuple[str, object]:
+    """Encode a level again, keeping what's encoded before the cells that
+    changed. The result is the same as encoding the whole level.
+
+    Args:
+        level (DecodedLevel): The level.
+        start (int): The index of the first cell that changed since state was
+            made.
+        state (object): What the last call returned for this level, None to
+            encode everything. It's changed and can't be used again.
+
+    Returns:
+        Tuple[str, object]: The level code and the state for the next call."""
 
     # gen  ror  rol  mov  sli  pus  wal  ene  tra
     # 01   23   45   67   89   ab   cd   ef   gh
@@ -78,37 +142,56 @@ def save(level: Level) -> str:
     # bg   place
     # {    }
 
-    level_string = ""
-    for _, _, cell, place in level:
-        if cell.type == CellEnum.bg:
-            level_string += b74_encode(72 + int(place))
-        else:
-            level_string += b74_encode(cell.type * 2 + cell.rotation * 18 + int(place))
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V2 encode")
+
+    level_string = b74_encode_digits(level.codes)
 
     # Remove the space using bgs at the end of the level
     level_string = re.sub(r"\{+$", "", level_string, 0)
-
-    result_level_string = ""
-    repeat = 0
-    previous = ""
-    for i in level_string:
-        if i == previous:
-            repeat += 1
-        else:
-            if repeat < 4:
-                result_level_string += previous * repeat
-            elif repeat < 74:
-                result_level_string += previous + ")" + b74_encode(repeat - 1)
-            else:
-                result_level_string += previous + "(" + b74_encode(repeat - 1) + ")"
-            repeat = 1
-            previous = i
-
-    if repeat < 4:
-        result_level_string += previous * repeat
-    elif repeat < 74:
-        result_level_string += previous + ")" + b74_encode(repeat - 1)
+    if profile is not None:
+        timer("digits")
+
+    if state is None:
+        # A token for every run of the same character, where it starts and
+        # the end of the character after it, which is read to end the run
+        tokens = []
+        starts = []
+        reaches = []
+        position = 0
     else:
-        result_level_string += previous + "(" + b74_encode(repeat - 1) + ")"
+        old_string, tokens, starts, reaches = state
+
+        # Runs that end before the cells that changed stay the same
+        unchanged = min(start, len(old_string), len(level_string))
+        kept = bisect.bisect_right(reaches, unchanged)
+        position = starts[kept] if kept < len(starts) else len(old_string)
+        del tokens[kept:], starts[kept:], reaches[kept:]
+
+    for match in _RUN.finditer(level_string, position):
+        previous = match[1]
+        repeat = match.end() - match.start()
+        if repeat < 4:
+            tokens.append(previous * repeat)
+        elif repeat < 74:
+            tokens.append(previous + ")" + b74_encode(repeat - 1))
+        else:
+            tokens.append(previous + "(" + b74_encode(repeat - 1) + ")")
+        starts.append(match.start())
+        reaches.append(match.end() + 1)
+
+    if profile is not None:
+        timer("runs")
+    result_level_string = "".join(tokens)
+    level_code = f"V2;{b74_encode(level.width)};{b74_encode(level.height)};{result_level_string};{level.tutorial_text};{level.name};{int(level.wall_effect)}"
 
-    return f"V2;{b74_encode(level.width)};{b74_encode(level.height)};{result_level_string};{level.tutorial_text};{level.name};{int(level.wall_effect)}"
+    if profile is not None:
+        timer("assemble")
+        profile.count("bytes out", len(level_code))
+        profile.count("cells encoded", len(level_string) - position)
+
+    return (
+        level_code,
+        (level_string, tokens, starts, reaches),
+    )
@@ -1,87 +1,660 @@
 """The level parser for V3 levels."""
 
-import re
-from typing import Tuple
-from .level import Level, Cell, CellEnum
+import bisect, re
+from typing import Dict, List, Optional, Tuple
+from . import instrument
+from .level import DecodedLevel, Level
 from .level import LevelParsingError, LevelTooBigError
-from .base74 import b74_decode, b74_encode
+from .base74 import b74_decode, b74_decode_digits, b74_encode, b74_encode_digits
 
+_B74 = r"[0-9a-zA-Z!$%&+\-.=?^{}]"
 
-def open(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> Level:
+# The level code is tokenized a field at a time, without going back
+_HEAD = re.compile(rf"V3;({_B74}+);({_B74}+);")
+# Cells, or a back-reference as )offset length, (offset)length or
+# (offset(length)
+_TOKEN = re.compile(
+    rf"({_B74}+)"
+    rf"|\)({_B74})({_B74})"
+    rf"|\(({_B74}+)\)({_B74})"
+    rf"|\(({_B74}+)\(({_B74}+)\)"
+)
+_TAIL = re.compile(r"([\w\d]*);([\w\d]*);([0-3]?)")
+
+
+def _error(message: str, position: int) -> LevelParsingError:
+    return LevelParsingError(
+        f"Invalid V3 level code, {message} at position {position}.", position
+    )
+
+
+def open(
+    level_code: str, max_size: Tuple[int, int] = (0, 0), backend: str = None
+) -> Level:
     """Use level.open, that's how to open a level."""
-    if re.match(
-        r"^V3;[\da-zA-Z!$%&+-.=?^{}]+;[\da-zA-Z!$%&+-.=?^{}]+;[\da-zA-Z!$%&+-.=?^{}()]*;[\w\d]*;[\w\d]*;[0-3]?$",
-        level_code,
+    decoded = decode(level_code, max_size)
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V3 open")
+    level = Level.from_codes(*decoded, backend)
+    if profile is not None:
+        timer("grid")
+    return level
+
+
+def decode(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> DecodedLevel:
+    """Use level.transcode, that's how to convert a level code."""
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V3 decode")
+
+    head = _HEAD.match(level_code)
+    if head is None:
+        raise LevelParsingError("Invalid V3 level code.", 0)
+    width, height = b74_decode(head[1]), b74_decode(head[2])
+
+    data_start = head.end()
+    data_end = level_code.find(";", data_start)
+    if data_end == -1:
+        raise _error("missing fields", len(level_code))
+    tail = _TAIL.fullmatch(level_code, data_end + 1)
+    if tail is None:
+        raise _error("invalid tutorial text, name or wall effect", data_end + 1)
+
+    if max_size[0] > 0 or max_size[1] > 0:
+        if width > max_size[0] or height > max_size[1]:
+            raise LevelTooBigError(
+                f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
+            )
+
+    if profile is not None:
+        timer("validate")
+
+    # Every cell starts as a bg that isn't placeable
+    codes = bytearray(b"\x48") * (width * height)
+    codes_index = 0
+
+    position = data_start
+    while position < data_end:
+        match = _TOKEN.match(level_code, position, data_end)
+        if match is None:
+            raise _error(f"unexpected {level_code[position]!r}", position)
+        cells = match[1]
+
+        if cells is not None:
+            if codes_index + len(cells) > len(codes):
+                raise _error("more cells than the level has", position)
+            codes[codes_index : codes_index + len(cells)] = b74_decode_digits(cells)
+            codes_index += len(cells)
+
+        else:
+            # The offset and length are the last two groups that matched
+            offset = b74_decode(match[match.lastindex - 1]) + 1
+            distance = b74_decode(match[match.lastindex])
+            start = codes_index - offset
+            if start < 0:
+                raise _error("a reference to cells before the start", position)
+            if codes_index + distance > len(codes):
+                raise _error("more cells than the level has", position)
+
+            # A run longer than the offset overlaps itself and repeats
+            pattern = codes[start:codes_index] * -(-distance // offset)
+            codes[codes_index : codes_index + distance] = pattern[:distance]
+            codes_index += distance
+
+        position = match.end()
+
+    if profile is not None:
+        timer("tokens")
+        profile.count("bytes in", len(level_code))
+        profile.count("cells decoded", width * height)
+        # Every back-reference has a single )
+        profile.count("references decoded", level_code.count(")", data_start, data_end))
+
+    return DecodedLevel(
+        width,
+        height,
+        codes,
+        tail[1],
+        tail[2],
+        int(tail[3]) if tail[3] != "" else 0,
+    )
+
+
+# Matches shorter than this are never worth a back-reference
+_MIN_MATCH = 4
+# Chain links followed before falling back to the suffix array
+_MAX_CHAIN = 64
+# How many characters the suffixes are first sorted by
+_SORT_PREFIX = 16
+
+
+def _match_length(level_string: str, match_index: int, data_index: int) -> int:
+    """Get how many characters from data_index repeat the ones from match_index.
+
+    Args:
+        level_string (str): The string being compressed.
+        match_index (int): The earlier position to compare against.
+        data_index (int): The current position.
+
+    Returns:
+        int: The length of the match, it can run past data_index."""
+    limit = len(level_string) - data_index
+
+    # Compare doubling chunks, then binary search the chunk that differs
+    low, step = 0, _MIN_MATCH
+    while (
+        low + step <= limit
+        and level_string[match_index + low : match_index + low + step]
+        == level_string[data_index + low : data_index + low + step]
     ):
-        level_list = level_code.split(";")
-
-        width, height = b74_decode(level_list[1]), b74_decode(level_list[2])
-
-        if max_size[0] > 0 or max_size[1] > 0:
-            if width > max_size[0] or height > max_size[1]:
-                raise LevelTooBigError(
-                    f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
-                )
-
-        level = Level(
-            width,
-            height,
-            level_list[4],
-            level_list[5],
-            int(level_list[6]) if level_list[6] != "" else 0,
-        )
+        low += step
+        step *= 2
+
+    high = min(low + step, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if (
+            level_string[match_index + low : match_index + middle]
+            == level_string[data_index + low : data_index + middle]
+        ):
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
 
-        level_cells = ""
-        data = level_list[3]
-        data_index = 0
-        while data_index < len(data):
-            if data[data_index] == "(" or data[data_index] == ")":
-                if data[data_index] == ")":
-                    offset = data[data_index + 1]
-                    distance = data[data_index + 2]
-                    data_index += 3
 
+class _SuffixArray:
+    """The suffixes of a string in sorted order, for the searches the hash
+    chains can't finish. Sorting takes longer than most searches, so it's
+    only done the first time it's needed.
+
+    Args:
+        string (str): The string."""
+
+    def __init__(self, string: str) -> None:
+        self.string = string
+        # Chain links that can still be followed past _MAX_CHAIN, sorting
+        # takes about as long as following one for every character
+        self.links_left = len(string)
+        # The start of every suffix in sorted order, and the place of every
+        # start in it, None until they're needed
+        self._order: Optional[List[int]] = None
+        self._ranks: Optional[List[int]] = None
+
+    def _sort(self) -> None:
+        # Sort by the first characters, then double how many characters are
+        # sorted by until every suffix is different
+        string, size = self.string, len(self.string)
+        length = _SORT_PREFIX
+        order = sorted(range(size), key=lambda start: string[start : start + length])
+        ranks = [0] * size
+        rank, last = 0, None
+        for start in order:
+            prefix = string[start : start + length]
+            if prefix != last:
+                rank += 1
+                last = prefix
+            ranks[start] = rank
+
+        while rank < size:
+            # Suffixes shorter than length already have a rank of their own
+            keys = [
+                first * (size + 1) + second
+                for first, second in zip(ranks, ranks[length:] + [0] * length)
+            ]
+            order.sort(key=keys.__getitem__)
+            rank, last = 0, None
+            for start in order:
+                if keys[start] != last:
+                    rank += 1
+                    last = keys[start]
+                ranks[start] = rank
+            length *= 2
+
+        self._order = order
+        self._ranks = ranks
+        self.links_left = 0
+
+    def longer_match(self, data_index: int, length: int) -> Tuple[int, int]:
+        """Find the longest match for data_index that's longer than length,
+        the closest one if there are more.
+
+        Args:
+            data_index (int): The current position.
+            length (int): How many characters the match has to beat.
+
+        Returns:
+            Tuple[int, int]: The length and the start of the match, length
+                and -1 if there is none."""
+        if self._order is None:
+            self._sort()
+        string, order = self.string, self._order
+        match_index = -1
+
+        # Suffixes further from data_index in the order share fewer characters
+        # with it, so both ways are walked until they share too few
+        rank = self._ranks[data_index] - 1
+        for step in (-1, 1):
+            other = rank + step
+            while 0 <= other < len(order):
+                start = order[other]
+                if (
+                    string[start : start + length + 1]
+                    == string[data_index : data_index + length + 1]
+                ):
+                    if start < data_index:
+                        match_index = start
+                        length = _match_length(string, start, data_index)
+                elif match_index != -1 and (
+                    string[start : start + length]
+                    == string[data_index : data_index + length]
+                ):
+                    if match_index < start < data_index:
+                        match_index = start
                 else:
-                    offset = ""
+                    break
+                other += step
+        return length, match_index
+
+
+def _find_match(
+    level_string: str,
+    data_index: int,
+    head: Dict[str, int],
+    chain: List[int],
+    suffixes: _SuffixArray,
+) -> Tuple[int, int]:
+    """Find the longest match for data_index, the closest one if there are more.
+
+    Args:
+        level_string (str): The string being compressed.
+        data_index (int): The current position.
+        head (Dict[str, int]): The most recent start of every piece before
+            data_index.
+        chain (List[int]): The previous start of the same piece for every
+            position, -1 if there is none.
+        suffixes (_SuffixArray): The suffixes of level_string, for when the
+            chain is too long to walk.
+
+    Returns:
+        Tuple[int, int]: The length and the offset of the match, (0, 0) if
+            there is none."""
+    if len(level_string) - data_index < _MIN_MATCH:
+        return 0, 0
+
+    match_index = head.get(level_string[data_index : data_index + _MIN_MATCH], -1)
+    if match_index == -1:
+        return 0, 0
+
+    max_match_index = match_index
+    max_match_length = 0
+
+    # Walk the chain from the closest start, only a longer match can win.
+    # Links past _MAX_CHAIN are only followed until the suffixes are worth
+    # sorting
+    links = 0
+    while match_index != -1 and data_index + max_match_length < len(level_string):
+        if links >= _MAX_CHAIN:
+            if suffixes.links_left <= 0:
+                break
+            suffixes.links_left -= 1
+        if (
+            level_string[match_index : match_index + max_match_length + 1]
+            == level_string[data_index : data_index + max_match_length + 1]
+        ):
+            max_match_index = match_index
+            max_match_length = _match_length(level_string, match_index, data_index)
+        match_index = chain[match_index]
+        links += 1
+    if match_index == -1 or data_index + max_match_length == len(level_string):
+        return max_match_length, data_index - max_match_index
+
+    # The rest of the chain is further away, so only longer matches can win
+    match_length, match_index = suffixes.longer_match(data_index, max_match_length)
+    if match_index != -1:
+        max_match_index = match_index
+        max_match_length = match_length
+
+    return max_match_length, data_index - max_match_index
+
+
+def _digits(number: int) -> int:
+    # How many base 74 digits a number takes
+    digits = 1
+    while number >= 74:
+        number //= 74
+        digits += 1
+    return digits
+
+
+def _token_length(distance: int, length: int) -> int:
+    """Get how many characters the back-reference for a match takes.
+
+    Args:
+        distance (int): How far back the match is, at least 1.
+        length (int): The length of the match.
+
+    Returns:
+        int: The length of )offset length, (offset)length or (offset(length)."""
+    length_digits = _digits(length)
+    if length_digits == 1:
+        return 3 if distance <= 74 else 3 + _digits(distance - 1)
+    return 3 + _digits(distance - 1) + length_digits
+
+
+def _token(distance: int, length: int) -> str:
+    # The back-reference for a match, the shortest way to write it
+    offset = b74_encode(distance - 1)
+    length = b74_encode(length)
+    if len(length) == 1:
+        if len(offset) == 1:
+            return ")" + offset + length
+        return "(" + offset + ")" + length
+    return "(" + offset + "(" + length + ")"
+
+
+def _add_pieces(
+    level_string: str, start: int, end: int, head: Dict[str, int], chain: List[int]
+) -> None:
+    # Add the pieces starting from start to before end to the hash chains
+    for index in range(start, end):
+        piece = level_string[index : index + _MIN_MATCH]
+        chain[index] = head.get(piece, -1)
+        head[piece] = index
+
+
+def _encode_lazy(level_string: str) -> str:
+    """Compress a level string, taking a match only if the match starting at
+    the next character doesn't save more.
+
+    Args:
+        level_string (str): The cells as base 74 digits.
+
+    Returns:
+        str: The compressed cells."""
+    tokens = []
+    head = {}
+    chain = [-1] * len(level_string)
+    suffixes = _SuffixArray(level_string)
+
+    data_index = 0
+    match = _find_match(level_string, 0, head, chain, suffixes)
+    while data_index < len(level_string):
+        length, distance = match
+        saved = length - _token_length(distance, length) if length else 0
+        _add_pieces(level_string, data_index, data_index + 1, head, chain)
+
+        if saved > 0 and data_index + 1 < len(level_string):
+            next_match = _find_match(
+                level_string, data_index + 1, head, chain, suffixes
+            )
+            if next_match[0]:
+                next_saved = next_match[0] - _token_length(*next_match[::-1])
+                if next_saved > saved:
+                    tokens.append(level_string[data_index])
                     data_index += 1
-                    while data[data_index] != "(" and data[data_index] != ")":
-                        offset += data[data_index]
-                        data_index += 1
-                    if data[data_index] == ")":
-                        distance = data[data_index + 1]
-                        data_index += 2
-                    else:
-                        distance = ""
-                        data_index += 1
-                        while data[data_index] != ")":
-                            distance += data[data_index]
-                            data_index += 1
-                        data_index += 1
-
-                for _ in range(b74_decode(distance)):
-                    level_cells += level_cells[-b74_decode(offset) - 1]
+                    match = next_match
+                    continue
 
-            else:
-                level_cells += data[data_index]
-                data_index += 1
+        if saved > 0:
+            tokens.append(_token(distance, length))
+            _add_pieces(level_string, data_index + 1, data_index + length, head, chain)
+            data_index += length
+        else:
+            tokens.append(level_string[data_index])
+            data_index += 1
+
+        if data_index < len(level_string):
+            match = _find_match(level_string, data_index, head, chain, suffixes)
+
+    return "".join(tokens)
+
+
+# Matches at least this long are taken whole, without trying shorter lengths
+_NICE_LENGTH = 128
+# How far back shorter matches are searched for, offsets up to 2 digits
+_SEARCH_WINDOW = 74 * 74
+
+
+def _find_matches(
+    level_string: str, data_index: int, head: Dict[str, int], chain: List[int]
+) -> List[Tuple[int, int]]:
+    """Find the closest match for every length, see _find_match.
+
+    Returns:
+        List[Tuple[int, int]]: The length and distance of every match that's
+            longer than the closer ones, from the closest."""
+    if len(level_string) - data_index < _MIN_MATCH:
+        return []
+
+    matches = []
+    longest = _MIN_MATCH - 1
+    match_index = head.get(level_string[data_index : data_index + _MIN_MATCH], -1)
+    for _ in range(_MAX_CHAIN):
+        if match_index == -1:
+            return matches
+        if (
+            level_string[match_index : match_index + longest + 1]
+            == level_string[data_index : data_index + longest + 1]
+        ):
+            longest = _match_length(level_string, match_index, data_index)
+            matches.append((longest, data_index - match_index))
+            if data_index + longest == len(level_string):
+                return matches
+        match_index = chain[match_index]
+
+    # Long chains come from long runs, searching the string is faster there.
+    # Every character is searched from, so only matches that will be taken
+    # whole are searched for in the whole string
+    while match_index != -1 and data_index + longest < len(level_string):
+        match_index = level_string.rfind(
+            level_string[data_index : data_index + longest + 1],
+            0 if longest >= _NICE_LENGTH else max(0, data_index - _SEARCH_WINDOW),
+            match_index + longest + 1,
+        )
+        if match_index != -1:
+            longest = _match_length(level_string, match_index, data_index)
+            matches.append((longest, data_index - match_index))
+
+    return matches
+
+
+def _encode_optimal(level_string: str) -> str:
+    """Compress a level string to the fewest characters it can, by finding the
+    cheapest way to reach every character with literals and matches.
+
+    Args:
+        level_string (str): The cells as base 74 digits.
+
+    Returns:
+        str: The compressed cells."""
+    size = len(level_string)
+    head = {}
+    chain = [-1] * size
+
+    # The fewest characters to encode everything before every index, and
+    # where the last token starts and its distance, 0 for a literal
+    costs = [0] + [size + 1] * size
+    previous = [(0, 0)] * (size + 1)
+
+    data_index = 0
+    while data_index < size:
+        cost = costs[data_index]
+        if cost + 1 < costs[data_index + 1]:
+            costs[data_index + 1] = cost + 1
+            previous[data_index + 1] = (data_index, 0)
+
+        matches = _find_matches(level_string, data_index, head, chain)
+        if matches and matches[-1][0] >= _NICE_LENGTH:
+            # Long matches are taken whole, the characters they cover are
+            # skipped
+            length, distance = matches[-1]
+            end = data_index + length
+            if cost + _token_length(distance, length) < costs[end]:
+                costs[end] = cost + _token_length(distance, length)
+                previous[end] = (data_index, distance)
+            _add_pieces(level_string, data_index, end, head, chain)
+            data_index = end
+            continue
+
+        # Every length can use the closest match that's at least that long
+        shortest = _MIN_MATCH
+        for longest, distance in matches:
+            for length in range(shortest, longest + 1):
+                end_cost = cost + _token_length(distance, length)
+                if end_cost < costs[data_index + length]:
+                    costs[data_index + length] = end_cost
+                    previous[data_index + length] = (data_index, distance)
+            shortest = longest + 1
+
+        _add_pieces(level_string, data_index, data_index + 1, head, chain)
+        data_index += 1
+
+    # Follow the cheapest tokens back from the end
+    tokens = []
+    end = size
+    while end > 0:
+        start, distance = previous[end]
+        if distance:
+            tokens.append(_token(distance, end - start))
+        else:
+            tokens.append(level_string[start])
+        end = start
+    tokens.reverse()
+    return "".join(tokens)
 
-        for i, j in enumerate(level_cells):
-            cell_num = b74_decode(j)
-            if cell_num > 71:
-                level[i % width, i // height] = cell_num % 2 == 1
+
+def save(level: Level, effort: int = 0) -> str:
+    """Use level.Level.save, that's how to save a level.
+
+    Args:
+        level (Level): The level.
+        effort (int): How hard to try to make the level code short. 0 takes
+            the longest match at every character, 1 also checks if the match
+            from the next character saves more, and 2 finds the shortest
+            level code it can, which is the slowest. More effort never makes
+            the level code longer."""
+    return encode(DecodedLevel.from_level(level), effort)
+
+
+def encode(level: DecodedLevel, effort: int = 0) -> str:
+    """Use level.transcode, that's how to convert a level code. See save for
+    the effort."""
+    if effort == 0:
+        return reencode(level, 0, None)[0]
+    if effort not in (1, 2):
+        raise ValueError(f"The effort has to be 0, 1 or 2, not {effort}.")
+
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer(f"V3 encode effort {effort}")
+
+    # Remove the space using bgs at the end of the level
+    level_string = b74_encode_digits(level.codes).rstrip("{")
+    if profile is not None:
+        timer("digits")
+    # Long matches are taken whole without searching the characters they
+    # cover, which can lose to less effort, so the shortest result is used
+    greedy = []
+    _encode_greedy(level_string, 0, greedy, [], [], {}, [-1] * len(level_string))
+    if effort == 1:
+        result_level_string = min(_encode_lazy(level_string), "".join(greedy), key=len)
+    else:
+        result_level_string = min(
+            _encode_optimal(level_string),
+            _encode_lazy(level_string),
+            "".join(greedy),
+            key=len,
+        )
+    if profile is not None:
+        timer("matches")
+
+    level_code = f"V3;{b74_encode(level.width)};{b74_encode(level.height)};{result_level_string};{level.tutorial_text};{level.name};{int(level.wall_effect)}"
+    if profile is not None:
+        timer("assemble")
+        profile.count("bytes out", len(level_code))
+        profile.count("cells encoded", len(level_string))
+    return level_code
+
+
+def _encode_greedy(
+    level_string: str,
+    data_index: int,
+    tokens: List[str],
+    starts: List[int],
+    reaches: List[int],
+    head: Dict[str, int],
+    chain: List[int],
+) -> None:
+    """Compress a level string from data_index, taking the longest match at
+    every character like the encoder that tried every offset. The tokens,
+    where they start and what they read are added to the lists, see
+    reencode.
+
+    Args:
+        level_string (str): The cells as base 74 digits.
+        data_index (int): The position to start from, the start of a token.
+        tokens (List[str]): The tokens before data_index.
+        starts (List[int]): Where every token starts.
+        reaches (List[int]): The furthest character read to make every token
+            or any token before it.
+        head (Dict[str, int]): The most recent start of every piece before
+            data_index.
+        chain (List[int]): The previous start of the same piece for every
+            position, -1 if there is none."""
+    reach = reaches[-1] if reaches else 0
+    suffixes = _SuffixArray(level_string)
+    while data_index < len(level_string):
+        max_match_length, max_match_offset = _find_match(
+            level_string, data_index, head, chain, suffixes
+        )
+
+        step = 1
+        token = level_string[data_index]
+        if max_match_length > 3:
+            length = b74_encode(max_match_length)
+            offset = b74_encode(max_match_offset - 1)
+            if len(length) == 1:
+                if len(offset) == 1:
+                    token = ")" + offset + length
+                    step = max_match_length
+                elif max_match_length > 3 + len(offset):
+                    token = "(" + offset + ")" + length
+                    step = max_match_length
             else:
-                level[i % width, i // height] = (
-                    Cell(cell_num // 2 % 9, cell_num // 18 % 4),
-                    cell_num % 2 == 1,
-                )
+                token = "(" + offset + "(" + length + ")"
+                step = max_match_length
+
+        # Finding the match reads one past it, adding the pieces reads the
+        # whole piece of the last cell
+        reach = max(
+            reach, data_index + max_match_length + 1, data_index + step + _MIN_MATCH - 1
+        )
+        tokens.append(token)
+        starts.append(data_index)
+        reaches.append(reach)
+        for index in range(data_index, data_index + step):
+            piece = level_string[index : index + _MIN_MATCH]
+            chain[index] = head.get(piece, -1)
+            head[piece] = index
+        data_index += step
 
-        return level
 
-    raise LevelParsingError("Invalid V3 level code.")
+def reencode(level: DecodedLevel, start: int, state: object) -> Tuple[str, object]:
+    """Encode a level again, keeping what's encoded before the cells that
+    changed. The result is the same as encoding the whole level.
 
+    Args:
+        level (DecodedLevel): The level.
+        start (int): The index of the first cell that changed since state was
+            made.
+        state (object): What the last call returned for this level, None to
+            encode everything. It's changed and can't be used again.
 
-def save(level: Level) -> str:
-    """Use level.Level.save, that's how to save a level."""
+    Returns:
+        Tuple[str, object]: The level code and the state for the next call."""
 
     # gen  ror  rol  mov  sli  pus  wal  ene  tra
     # 01   23   45   67   89   ab   cd   ef   gh
@@ -92,71 +665,61 @@ def save(level: Level) -> str:
     # bg   place
     # {    }
 
-    level_string = ""
-    for _, _, cell, place in level:
-        if cell.type == CellEnum.bg:
-            level_string += b74_encode(72 + int(place))
-        else:
-            level_string += b74_encode(cell.type * 2 + cell.rotation * 18 + int(place))
+    profile = instrument.active
+    if profile is not None:
+        timer = profile.timer("V3 encode")
+
+    level_string = b74_encode_digits(level.codes)
 
     # Remove the space using bgs at the end of the level
     level_string = re.sub(r"\{+$", "", level_string, 0)
+    if profile is not None:
+        timer("digits")
 
-    result_level_string = ""
-
-    max_match_offset = 0
-    data_index = 0
+    if state is None:
+        tokens = []
+        # Where every token starts, and the furthest character read to make
+        # it or any token before it
+        starts = []
+        reaches = []
+        # Hash chains over every _MIN_MATCH long piece seen so far
+        head = {}
+        chain = [-1] * len(level_string)
+        data_index = 0
+    else:
+        old_string, tokens, starts, reaches, head, chain = state
 
-    while data_index < len(level_string):
-        max_match_length = 0
-        for match_offset in range(1, data_index + 1):
-            match_length = 0
-            while (
-                data_index + match_length < len(level_string)
-                and level_string[data_index + match_length]
-                == level_string[data_index + match_length - match_offset]
-            ):
-                match_length += 1
-                if match_length > max_match_length:
-                    max_match_length = match_length
-                    max_match_offset = match_offset - 1
+        # Tokens that only read characters that didn't change stay the same
+        unchanged = min(start, len(old_string), len(level_string))
+        kept = bisect.bisect_right(reaches, unchanged)
+        data_index = starts[kept] if kept < len(starts) else len(old_string)
+        del tokens[kept:], starts[kept:], reaches[kept:]
 
-        if max_match_length > 3:
-            if len(b74_encode(max_match_length)) == 1:
-                if len(b74_encode(max_match_offset)) == 1:
-                    if max_match_length > 3:
-                        result_level_string += (
-                            ")"
-                            + b74_encode(max_match_offset)
-                            + b74_encode(max_match_length)
-                        )
-                        data_index += max_match_length - 1
-                    else:
-                        result_level_string += level_string[data_index]
-                else:
-                    if max_match_length > 3 + len(b74_encode(max_match_offset)):
-                        result_level_string += (
-                            "("
-                            + b74_encode(max_match_offset)
-                            + ")"
-                            + b74_encode(max_match_length)
-                        )
-                        data_index += max_match_length - 1
-                    else:
-                        result_level_string += level_string[data_index]
+        # Take the pieces after data_index back out of the hash chains
+        for index in range(len(old_string) - 1, data_index - 1, -1):
+            piece = old_string[index : index + _MIN_MATCH]
+            if chain[index] == -1:
+                del head[piece]
             else:
-                result_level_string += (
-                    "("
-                    + b74_encode(max_match_offset)
-                    + "("
-                    + b74_encode(max_match_length)
-                    + ")"
-                )
-                data_index += max_match_length - 1
-        else:
-            result_level_string += level_string[data_index]
+                head[piece] = chain[index]
+        del chain[data_index:]
+        chain.extend([-1] * (len(level_string) - data_index))
 
-        max_match_length = 0
-        data_index += 1
+    first_index, first_token = data_index, len(tokens)
+    _encode_greedy(level_string, data_index, tokens, starts, reaches, head, chain)
 
-    return f"V3;{b74_encode(level.width)};{b74_encode(level.height)};{result_level_string};{level.tutorial_text};{level.name};{int(level.wall_effect)}"
+    if profile is not None:
+        timer("matches")
+    result_level_string = "".join(tokens)
+    level_code = f"V3;{b74_encode(level.width)};{b74_encode(level.height)};{result_level_string};{level.tutorial_text};{level.name};{int(level.wall_effect)}"
+
+    if profile is not None:
+        timer("assemble")
+        profile.count("bytes out", len(level_code))
+        profile.count("cells encoded", len(level_string) - first_index)
+        profile.count("matches tried", len(tokens) - first_token)
+
+    return (
+        level_code,
+        (level_string, tokens, starts, reaches, head, chain),
+    )
@@ -6,4 +6,4 @@ _plugins = [
     "V3",
 ]
 
-from . import base74, level
+from . import base74, formats, instrument, level, cache, corpus, dedup
@@ -1,6 +1,14 @@
-"""CLI for cell_machine_levels."""
+"""CLI for cell_machine_levels.
 
-import cell_machine_levels
+Without arguments it shows menus, with a command it runs it and exits:
+
+    cell_machine_levels convert --to V3 [--optimize] [--jobs N] [--profile] [files...]
+
+convert reads a level code per line from the files or stdin and writes every
+converted code to stdout, in the same order. --profile writes where the time
+went to stderr after converting, see instrument.Profile."""
+
+import argparse, cell_machine_levels, functools, multiprocessing, os, sys
 from BlockOL import teef
 
 get_level_code = lambda: input("Input level code (V1, V2 or V3): ")
@@ -76,8 +84,110 @@ menus = [
 ]
 
 
-def main():
-    """Main CLI."""
+def _convert(level_code: str, format: str, optimize: bool) -> tuple:
+    # Runs in the worker processes, so errors are returned instead of raised
+    if not level_code:
+        return "", None
+
+    try:
+        if not optimize:
+            # Converting the cell codes directly is faster than making a Level
+            return cell_machine_levels.level.transcode(level_code, format), None
+        level = cell_machine_levels.level.open(level_code)
+    except (cell_machine_levels.level.LevelParsingError, ValueError) as e:
+        return "", str(e) or "Invalid level code"
+
+    level.optimize()
+    return level.save(format), None
+
+
+def _convert_profiled(level_code: str, format: str, optimize: bool) -> tuple:
+    # Every level code is measured on its own, so the worker processes can
+    # send what they measured back with the result
+    with cell_machine_levels.instrument.Profile() as profile:
+        level_code, error = _convert(level_code, format, optimize)
+    return level_code, error, profile
+
+
+def _read_lines(files: list):
+    for file in files:
+        for line in file:
+            yield line.rstrip("\r\n")
+
+
+def _at_least(minimum: int):
+    # An argparse type for whole numbers that can't be lower than minimum
+    def parse(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{value!r} isn't a whole number")
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"{number} is lower than {minimum}")
+        return number
+
+    return parse
+
+
+def convert(args: argparse.Namespace) -> int:
+    """Convert level codes, see the convert command.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments.
+
+    Returns:
+        int: The exit code, 1 if any level code couldn't be converted."""
+    files = [
+        sys.stdin if path == "-" else open(path, encoding="utf-8")
+        for path in args.files or ["-"]
+    ]
+    profile = cell_machine_levels.instrument.Profile() if args.profile else None
+    convert_line = functools.partial(
+        _convert if profile is None else _convert_profiled,
+        format=args.to,
+        optimize=args.optimize,
+    )
+    jobs = args.jobs or os.cpu_count() or 1
+
+    try:
+        if jobs == 1:
+            failed = _write_results(map(convert_line, _read_lines(files)), profile)
+        else:
+            # imap keeps the order and sends the level codes in chunks
+            with multiprocessing.Pool(jobs) as pool:
+                failed = _write_results(
+                    pool.imap(
+                        convert_line, _read_lines(files), chunksize=args.chunk_size
+                    ),
+                    profile,
+                )
+    finally:
+        for file in files:
+            if file is not sys.stdin:
+                file.close()
+
+    if profile is not None:
+        print(profile.report(), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _write_results(
+    results, profile: "cell_machine_levels.instrument.Profile" = None
+) -> int:
+    # Failed level codes are written as empty lines, so lines still match up
+    failed = 0
+    for line_number, (level_code, error, *measured) in enumerate(results, 1):
+        if error is not None:
+            failed += 1
+            print(f"Line {line_number}: {error}", file=sys.stderr)
+        sys.stdout.write(level_code + "\n")
+        if profile is not None:
+            profile.merge(measured[0])
+    return failed
+
+
+def menu():
+    """Menu CLI."""
     current_menu = 0
 
     while True:
@@ -95,5 +205,53 @@ def main():
             continue
 
 
+def main(argv: list = None) -> int:
+    """Main CLI.
+
+    Args:
+        argv (list): The arguments, sys.argv[1:] by default.
+
+    Returns:
+        int: The exit code."""
+    parser = argparse.ArgumentParser(prog="cell_machine_levels")
+    commands = parser.add_subparsers(dest="command")
+
+    convert_parser = commands.add_parser(
+        "convert", help="convert level codes to another format"
+    )
+    convert_parser.add_argument(
+        "files", nargs="*", help="files with a level code per line, - for stdin"
+    )
+    convert_parser.add_argument(
+        "--to", required=True, choices=cell_machine_levels.formats.names()
+    )
+    convert_parser.add_argument(
+        "--optimize", action="store_true", help="optimize the levels first"
+    )
+    convert_parser.add_argument(
+        "--jobs",
+        type=_at_least(0),
+        default=1,
+        help="processes to convert with, 0 for one per CPU (default: 1)",
+    )
+    convert_parser.add_argument(
+        "--chunk-size",
+        type=_at_least(1),
+        default=256,
+        help="level codes sent to a process at once (default: 256)",
+    )
+
+    convert_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write the time spent in every phase to stderr after converting",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        return convert(args)
+    menu()
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -3,6 +3,12 @@
 b74_key = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!$%&+-.=?^{}"
 
 
+# Lookup tables for the digits, 255 isn't a digit
+_b74_values = {char: value for value, char in enumerate(b74_key)}
+_b74_decode_table = bytes(_b74_values.get(chr(byte), 255) for byte in range(256))
+_b74_encode_table = b74_key.encode("ascii") + bytes((255,)) * (256 - 74)
+
+
 def b74_decode(chars: str, /) -> int:
     """Decode base 74 number to regular integer.
 
@@ -12,11 +18,15 @@ def b74_decode(chars: str, /) -> int:
     Returns:
         integer: The decoded number.
     """
+    # Most numbers in level codes are a single digit
+    if len(chars) == 1 and chars in _b74_values:
+        return _b74_values[chars]
+
     result = 0
 
     for char in chars:
         result *= 74
-        if (b74_char := b74_key.find(char)) == -1:
+        if (b74_char := _b74_values.get(char, -1)) == -1:
             raise ValueError(f"Invalid character in base 74 number: {char}")
         else:
             result = result + b74_char
@@ -32,15 +42,64 @@ def b74_encode(num: int, /) -> str:
 
     Returns:
         string: The base 74 number.
+
+    Raises:
+        ValueError: If the number is negative.
     """
-    if num < 10:
-        return str(num)
+    if num < 0:
+        raise ValueError(f"Can't encode the negative number {num}.")
+    if num < 74:
+        return b74_key[num]
 
     result = ""
-    counter = 0
 
-    while num >= (74**counter):
-        result = b74_key[num // (74**counter) % 74] + result
-        counter += 1
+    while num:
+        num, digit = divmod(num, 74)
+        result = b74_key[digit] + result
 
     return result
+
+
+def b74_decode_digits(chars: str, /) -> bytes:
+    """Decode every character of a string as its own base 74 digit, like the
+    cells of V2 and V3 level codes.
+
+    Args:
+        chars (string): The base 74 digits to decode.
+
+    Returns:
+        bytes: The decoded digits.
+    """
+    try:
+        result = chars.encode("ascii").translate(_b74_decode_table)
+    except UnicodeEncodeError as e:
+        raise ValueError(
+            f"Invalid character in base 74 number: {chars[e.start]}"
+        ) from None
+
+    if 255 in result:
+        raise ValueError(
+            f"Invalid character in base 74 number: {chars[result.index(255)]}"
+        )
+
+    return result
+
+
+def b74_encode_digits(digits: bytes, /) -> str:
+    """Encode every number from 0 to 73 as its own base 74 digit, like the
+    cells of V2 and V3 level codes.
+
+    Args:
+        digits (bytes): The numbers to encode.
+
+    Returns:
+        string: The base 74 digits.
+    """
+    result = bytes(digits).translate(_b74_encode_table)
+
+    if 255 in result:
+        raise ValueError(
+            f"Number too big for a base 74 digit: {digits[result.index(255)]}"
+        )
+
+    return result.decode("ascii")
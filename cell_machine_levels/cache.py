@@ -0,0 +1,129 @@
+"""This module contains a cache for opening the same level codes again.
+
+The cache keeps the levels it opened, and gives out clones of them. Clones
+share the cells until they're changed, so getting a level from the cache is
+cheap and changing it doesn't change the cached level."""
+
+import sys, threading
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+from . import instrument, level as _level
+from .level import Level, LevelTooBigError
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a LevelCache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    nbytes: int
+
+
+class LevelCache:
+    """A cache of opened levels, the least recently used levels are removed
+    when it's full.
+
+    Args:
+        max_entries (int): The most levels to keep, 0 for no limit.
+        max_bytes (int): The most bytes the level codes and cells of the kept
+            levels can take, 0 for no limit."""
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 0) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._levels = OrderedDict()
+        self._nbytes = 0
+        self._hits = self._misses = self._evictions = 0
+        self._lock = threading.Lock()
+
+    def open(
+        self,
+        level_code: str,
+        max_size: Tuple[int, int] = (0, 0),
+        backend: str = None,
+    ) -> Level:
+        """Open a level from a level code, see level.open.
+
+        Args:
+            level_code (str): The level code.
+            max_size (Tuple[int, int]): The maximum size of the level.
+            backend (str): The backend to store the cells with.
+
+        Returns:
+            Level: A clone of the cached level, it can be changed freely.
+
+        Raises:
+            LevelParseError: If the level code is invalid.
+            LevelTooBigError: If the level is bigger than the given max size."""
+        key = (level_code, backend)
+        with self._lock:
+            cached = self._levels.get(key)
+            if cached is None:
+                self._misses += 1
+            else:
+                self._levels.move_to_end(key)
+                self._hits += 1
+                result = cached[0].clone()
+
+        profile = instrument.active
+        if profile is not None:
+            profile.count("cache misses" if cached is None else "cache hits")
+
+        if cached is None:
+            # Levels that are too big raise here, so they're never cached
+            result = _level.open(level_code, max_size, backend)
+            self._add(key, result.clone())
+            return result
+
+        if max_size[0] > 0 or max_size[1] > 0:
+            if result.width > max_size[0] or result.height > max_size[1]:
+                raise LevelTooBigError(
+                    f"Level is too big. Max size is {max_size[0]}x{max_size[1]}."
+                )
+        return result
+
+    def _add(self, key: Tuple[str, str], level: Level) -> None:
+        nbytes = sys.getsizeof(key[0]) + level.nbytes
+        if self.max_bytes and nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._levels:
+                return
+            self._levels[key] = (level, nbytes)
+            self._nbytes += nbytes
+
+            # Remove the least recently used levels until it fits
+            while (self.max_entries and len(self._levels) > self.max_entries) or (
+                self.max_bytes and self._nbytes > self.max_bytes
+            ):
+                _, (_, removed_nbytes) = self._levels.popitem(last=False)
+                self._nbytes -= removed_nbytes
+                self._evictions += 1
+
+    def info(self) -> CacheInfo:
+        """Get the statistics of the cache.
+
+        Returns:
+            CacheInfo: The hits, misses, evictions, entries and bytes used."""
+        with self._lock:
+            return CacheInfo(
+                self._hits,
+                self._misses,
+                self._evictions,
+                len(self._levels),
+                self._nbytes,
+            )
+
+    def clear(self) -> None:
+        """Remove every level from the cache and reset the statistics."""
+        with self._lock:
+            self._levels.clear()
+            self._nbytes = 0
+            self._hits = self._misses = self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._levels)
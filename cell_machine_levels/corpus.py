@@ -0,0 +1,319 @@
+"""This module reads and writes corpus files, files of level codes with a level
+code per line.
+
+Corpus files are memory mapped instead of read, so files bigger than the
+memory can be read with the same memory as small ones, the system keeps only
+the parts being read in memory. Level codes are decoded one at a time while
+iterating.
+
+An index of where every level code starts gives random access to the level
+codes. It can be saved next to the corpus file, so it's only made once."""
+
+import mmap, sys
+from array import array
+from typing import Iterator, NamedTuple, Optional, Tuple, Union
+from . import level as _level
+from .base74 import b74_decode
+from .level import Level, LevelParsingError
+
+
+class CorpusRecord(NamedTuple):
+    """What's in the fields of a level code, without decoding its cells."""
+
+    # Where the level code is in the file, in bytes
+    offset: int
+    length: int
+    format: str
+    width: int
+    height: int
+    name: str
+    wall_effect: int
+
+
+class CorpusReader:
+    """A reader of a corpus file. Empty lines are skipped, so they aren't
+    counted as level codes.
+
+    Args:
+        path (str): The path of the corpus file.
+        index (str): The path of an index saved with save_index, it's loaded
+            if it's given.
+
+    Raises:
+        ValueError: If the index isn't for this corpus file."""
+
+    def __init__(self, path: str, index: str = None) -> None:
+        self._file = open(path, "rb")
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files can't be mapped
+            self._data = b""
+        else:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):  # Python 3.8 and newer on Unix
+                self._data.madvise(mmap.MADV_SEQUENTIAL)
+
+        # Where every level code starts, None until it's needed
+        self._offsets: Optional[array] = None
+        if index is not None:
+            self.load_index(index)
+
+    def _lines(self, start: int = 0) -> Iterator[Tuple[int, int]]:
+        # The start and end of every line that isn't empty, without \r\n
+        data = self._data
+        size = len(data)
+        while start < size:
+            end = data.find(b"\n", start)
+            if end == -1:
+                end = size
+            next_start = end + 1
+            if end > start and data[end - 1] == 13:
+                end -= 1
+            if end > start:
+                yield start, end
+            start = next_start
+
+    def codes(self) -> Iterator[Tuple[int, str]]:
+        """Iterate over the level codes.
+
+        Returns:
+            Iterator[Tuple[int, str]]: The offset in the file and the level
+                code of every level code."""
+        for start, end in self._lines():
+            yield start, self._data[start:end].decode()
+
+    def levels(
+        self, max_size: Tuple[int, int] = (0, 0), backend: str = None
+    ) -> Iterator[Tuple[int, Level]]:
+        """Iterate over the levels, a level is only opened when it's reached.
+
+        Args:
+            max_size (Tuple[int, int]): The maximum size of the levels.
+            backend (str): The backend to store the cells with, see
+                level.open.
+
+        Returns:
+            Iterator[Tuple[int, Level]]: The offset in the file and the level
+                of every level code.
+
+        Raises:
+            LevelParseError: If a level code is invalid.
+            LevelTooBigError: If a level is bigger than the given max size."""
+        for offset, level_code in self.codes():
+            yield offset, _level.open(level_code, max_size, backend)
+
+    def records(self) -> Iterator[CorpusRecord]:
+        """Iterate over the fields of the level codes without decoding the
+        cells, which is much faster than opening them.
+
+        Returns:
+            Iterator[CorpusRecord]: The record of every level code.
+
+        Raises:
+            LevelParseError: If the fields of a level code are invalid."""
+        for start, end in self._lines():
+            yield _record(start, end, self._data[start:end].decode())
+
+    # Random access
+
+    def build_index(self) -> None:
+        """Find where every level code starts, so they can be gotten by their
+        number. It's done the first time it's needed if it isn't loaded."""
+        self._offsets = array("Q", (start for start, _ in self._lines()))
+
+    def load_index(self, path: str) -> None:
+        """Load an index saved with save_index.
+
+        Args:
+            path (str): The path of the index.
+
+        Raises:
+            ValueError: If the index isn't for this corpus file."""
+        self._offsets = _read_index(path, len(self._data))
+
+    def save_index(self, path: str) -> None:
+        """Save the index, so it can be loaded instead of being made again.
+
+        Args:
+            path (str): The path to save the index to."""
+        if self._offsets is None:
+            self.build_index()
+        _write_index(path, len(self._data), self._offsets)
+
+    def _line(self, number: int) -> Tuple[int, int]:
+        if self._offsets is None:
+            self.build_index()
+        start = self._offsets[number]
+        return next(self._lines(start))
+
+    def __len__(self) -> int:
+        if self._offsets is None:
+            self.build_index()
+        return len(self._offsets)
+
+    def __getitem__(self, number: int) -> str:
+        start, end = self._line(number)
+        return self._data[start:end].decode()
+
+    def open(
+        self, number: int, max_size: Tuple[int, int] = (0, 0), backend: str = None
+    ) -> Level:
+        """Open a level by its number.
+
+        Args:
+            number (int): The number of the level code, from 0.
+            max_size (Tuple[int, int]): The maximum size of the level.
+            backend (str): The backend to store the cells with, see
+                level.open.
+
+        Returns:
+            Level: The level.
+
+        Raises:
+            IndexError: If there aren't that many level codes.
+            LevelParseError: If the level code is invalid.
+            LevelTooBigError: If the level is bigger than the given max size."""
+        return _level.open(self[number], max_size, backend)
+
+    def record(self, number: int) -> CorpusRecord:
+        """Get the fields of a level code by its number, see records.
+
+        Args:
+            number (int): The number of the level code, from 0.
+
+        Returns:
+            CorpusRecord: The record.
+
+        Raises:
+            IndexError: If there aren't that many level codes.
+            LevelParseError: If the fields of the level code are invalid."""
+        start, end = self._line(number)
+        return _record(start, end, self._data[start:end].decode())
+
+    def close(self) -> None:
+        """Close the corpus file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> "CorpusReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CorpusWriter:
+    """A writer of a corpus file, the level codes are buffered and written in
+    big blocks.
+
+    Args:
+        path (str): The path of the corpus file.
+        format (str): The format to save levels in.
+        index (str): The path to save the index of the level codes to when the
+            writer is closed, see CorpusReader.save_index.
+        buffer_size (int): How many bytes to buffer before writing them."""
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "V3",
+        index: str = None,
+        buffer_size: int = 1 << 20,
+    ) -> None:
+        self.format = format
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._index = index
+        self._offset = 0
+        self._offsets = array("Q") if index is not None else None
+
+    def write(self, level: Union[Level, str]) -> int:
+        """Write a level.
+
+        Args:
+            level (Union[Level, str]): The level, or its level code.
+
+        Returns:
+            int: The offset of the level code in the file.
+
+        Raises:
+            ValueError: If the format doesn't exist, or the level code is empty
+                or has a line break, which the reader wouldn't read back."""
+        if isinstance(level, Level):
+            level = level.save(self.format)
+        if not level or "\n" in level or "\r" in level:
+            raise ValueError(
+                "Level codes can't be empty or have line breaks in a corpus."
+            )
+        line = level.encode() + b"\n"
+
+        offset = self._offset
+        self._file.write(line)
+        self._offset += len(line)
+        if self._offsets is not None:
+            self._offsets.append(offset)
+        return offset
+
+    def close(self) -> None:
+        """Write what's buffered and close the corpus file, and save the index
+        if there is one."""
+        if self._file.closed:
+            return
+        self._file.close()
+        if self._index is not None:
+            _write_index(self._index, self._offset, self._offsets)
+
+    def __enter__(self) -> "CorpusWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _record(start: int, end: int, level_code: str) -> CorpusRecord:
+    # The size is at the start and the name and wall effect at the end of
+    # every format
+    head = level_code.split(";", 3)
+    tail = level_code.rsplit(";", 2)
+    if len(head) < 4 or len(tail) < 3:
+        raise LevelParsingError("Invalid level code, missing fields.")
+
+    try:
+        # V1 is the only format with decimal sizes
+        if head[0] == "V1":
+            width, height = int(head[1]), int(head[2])
+        else:
+            width, height = b74_decode(head[1]), b74_decode(head[2])
+        wall_effect = int(tail[2]) if tail[2] != "" else 0
+    except ValueError:
+        raise LevelParsingError(
+            "Invalid level code, invalid size or wall effect."
+        ) from None
+
+    return CorpusRecord(
+        start, end - start, head[0], width, height, tail[1], wall_effect
+    )
+
+
+# Indexes start with the size of the corpus file they're for, then the offsets,
+# every number is 8 bytes in little endian
+
+
+def _write_index(path: str, size: int, offsets: array) -> None:
+    numbers = array("Q", [size])
+    numbers.extend(offsets)
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    with open(path, "wb") as file:
+        numbers.tofile(file)
+
+
+def _read_index(path: str, size: int) -> array:
+    numbers = array("Q")
+    with open(path, "rb") as file:
+        numbers.frombytes(file.read())
+    if sys.byteorder == "big":
+        numbers.byteswap()
+
+    if not numbers or numbers[0] != size:
+        raise ValueError(f"The index {path} isn't for this corpus file.")
+    return numbers[1:]
@@ -0,0 +1,141 @@
+"""This module finds levels that are the same, even if they're rotated,
+mirrored or saved in different formats.
+
+Every level is turned into a key, the smallest of its 8 rotations and mirrors
+as cell codes, and the index keeps the levels by the hash of their key, so
+finding a level takes the same time no matter how many levels there are.
+
+Levels with the same cells and wall effect are the same level, the name and
+tutorial text aren't compared. Cells whose rotation doesn't change what they
+do are compared without it, like Level.optimize does."""
+
+import hashlib
+from typing import Dict, Hashable, List, Optional, Union
+from . import formats
+from .grid import _move_codes
+from .level import DecodedLevel, Level, LevelParsingError
+from .level import _MIRROR_TABLE, _OPTIMIZE_TABLE, _TURN_TABLES
+
+# The table for every way to turn and mirror cells, they're optimized again
+# after, since a slide can be turned to 2
+_SYMMETRY_TABLES = {
+    (turns, mirror): (_MIRROR_TABLE if mirror else _OPTIMIZE_TABLE)
+    .translate(_TURN_TABLES[turns])
+    .translate(_OPTIMIZE_TABLE)
+    for turns in range(4)
+    for mirror in (False, True)
+}
+
+
+def level_key(level: Union[Level, DecodedLevel, str], symmetries: bool = True) -> bytes:
+    """Get the key of a level, levels that are the same have the same key.
+
+    Args:
+        level (Union[Level, DecodedLevel, str]): The level, or its level
+            code, which is decoded without making a Level if its format can.
+        symmetries (bool): If rotated and mirrored levels are the same.
+
+    Returns:
+        bytes: The key, a 32 byte hash.
+
+    Raises:
+        LevelParseError: If the level code is invalid."""
+    if isinstance(level, str):
+        level = _decode(level)
+    elif isinstance(level, Level):
+        level = DecodedLevel.from_level(level)
+
+    width, height = level.width, level.height
+    codes = bytes(level.codes).translate(_OPTIMIZE_TABLE)
+
+    candidates = [(width, height, codes)]
+    if symmetries:
+        for (turns, mirror), table in _SYMMETRY_TABLES.items():
+            if turns or mirror:
+                moved = _move_codes(width, height, codes, turns, mirror)
+                if turns % 2 == 1:
+                    candidates.append((height, width, moved.translate(table)))
+                else:
+                    candidates.append((width, height, moved.translate(table)))
+
+    width, height, codes = min(candidates)
+    key = hashlib.blake2b(digest_size=32)
+    key.update(b"%d;%d;%d;" % (width, height, int(level.wall_effect)))
+    key.update(codes)
+    return key.digest()
+
+
+def _decode(level_code: str) -> DecodedLevel:
+    format = level_code.partition(";")[0]
+    try:
+        decode = formats.get_decode(format)
+    except KeyError:
+        raise LevelParsingError(
+            f"The format {format} is not supported or doesn't exist."
+        ) from None
+    if decode is None:
+        return DecodedLevel.from_level(formats.get_open(format)(level_code))
+    return decode(level_code)
+
+
+class DedupIndex:
+    """An index of levels that finds the levels that are the same as others.
+
+    Args:
+        symmetries (bool): If rotated and mirrored levels are the same."""
+
+    def __init__(self, symmetries: bool = True) -> None:
+        self.symmetries = symmetries
+        # The names of the levels with every key, in the order they were added
+        self._levels: Dict[bytes, List[Hashable]] = {}
+
+    def add(
+        self, level: Union[Level, DecodedLevel, str], name: Hashable = None
+    ) -> Optional[Hashable]:
+        """Add a level.
+
+        Args:
+            level (Union[Level, DecodedLevel, str]): The level, or its level
+                code.
+            name (Hashable): What to call the level in the results, like its
+                number or offset in a corpus. The level itself by default.
+
+        Returns:
+            Optional[Hashable]: The name of the first level added that's the
+                same, None if this level is new.
+
+        Raises:
+            LevelParseError: If the level code is invalid."""
+        names = self._levels.setdefault(level_key(level, self.symmetries), [])
+        names.append(level if name is None else name)
+        return names[0] if len(names) > 1 else None
+
+    def find(self, level: Union[Level, DecodedLevel, str]) -> List[Hashable]:
+        """Find the levels that are the same as a level, without adding it.
+
+        Args:
+            level (Union[Level, DecodedLevel, str]): The level, or its level
+                code.
+
+        Returns:
+            List[Hashable]: The names of the levels, in the order they were
+                added.
+
+        Raises:
+            LevelParseError: If the level code is invalid."""
+        return list(self._levels.get(level_key(level, self.symmetries), []))
+
+    def duplicates(self) -> List[List[Hashable]]:
+        """Get the groups of levels that are the same.
+
+        Returns:
+            List[List[Hashable]]: The names of the levels in every group with
+                more than one level."""
+        return [list(names) for names in self._levels.values() if len(names) > 1]
+
+    def __contains__(self, level: Union[Level, DecodedLevel, str]) -> bool:
+        return level_key(level, self.symmetries) in self._levels
+
+    def __len__(self) -> int:
+        # The amount of different levels
+        return len(self._levels)
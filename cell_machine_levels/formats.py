@@ -0,0 +1,182 @@
+"""This module keeps track of the formats levels can be opened and saved in.
+
+A format is a module with an open and a save function, like V1, V2 and V3. The
+format of a level code is everything before its first ;. Formats are imported
+the first time they're used, and their functions are kept, so finding one is a
+single dict lookup.
+
+Formats can also have a decode and an encode function, which work with
+level.DecodedLevel instead of Level, so level.transcode doesn't make a Level.
+A reencode(level, start, state) function lets Level.save encode only from the
+first cell that changed since the level was last saved.
+
+Other packages can add formats with an entry point in the
+cell_machine_levels.formats group, named after the format and pointing to the
+module, for example V4 = some_package.V4 in setup.cfg."""
+
+import importlib
+from typing import Callable, Dict, List, Optional
+from . import _plugins
+
+ENTRY_POINT_GROUP = "cell_machine_levels.formats"
+
+# Functions that import the formats that haven't been used yet
+_loaders: Dict[str, Callable[[], object]] = {
+    plugin: (lambda plugin=plugin: importlib.import_module(f".{plugin}", __package__))
+    for plugin in _plugins
+}
+# The functions of the formats that have been used, None if they're missing
+_opens: Dict[str, Callable] = {}
+_saves: Dict[str, Callable] = {}
+_decodes: Dict[str, Optional[Callable]] = {}
+_encodes: Dict[str, Optional[Callable]] = {}
+_reencodes: Dict[str, Optional[Callable]] = {}
+_found_entry_points = False
+
+
+def register(name: str, module: object) -> None:
+    """Add a format, or replace the one with the same name.
+
+    Args:
+        name (str): The name of the format, what its level codes start with.
+        module (object): The format, anything with an open(level_code,
+            max_size, backend) and a save(level) function, or the name of a
+            module to import when it's first used."""
+    if isinstance(module, str):
+        _loaders[name] = lambda: importlib.import_module(module)
+    else:
+        _loaders[name] = lambda: module
+    for functions in (_opens, _saves, _decodes, _encodes, _reencodes):
+        functions.pop(name, None)
+
+
+def names() -> List[str]:
+    """Get the names of all formats.
+
+    Returns:
+        List[str]: The names."""
+    _find_entry_points()
+    return list(_loaders)
+
+
+def get_open(name: str) -> Callable:
+    """Get the open function of a format.
+
+    Args:
+        name (str): The name of the format.
+
+    Returns:
+        Callable: The function.
+
+    Raises:
+        KeyError: If the format doesn't exist."""
+    try:
+        return _opens[name]
+    except KeyError:
+        _load(name)
+        return _opens[name]
+
+
+def get_save(name: str) -> Callable:
+    """Get the save function of a format.
+
+    Args:
+        name (str): The name of the format.
+
+    Returns:
+        Callable: The function.
+
+    Raises:
+        KeyError: If the format doesn't exist."""
+    try:
+        return _saves[name]
+    except KeyError:
+        _load(name)
+        return _saves[name]
+
+
+def get_decode(name: str) -> Optional[Callable]:
+    """Get the decode function of a format.
+
+    Args:
+        name (str): The name of the format.
+
+    Returns:
+        Optional[Callable]: The function, None if the format doesn't have one.
+
+    Raises:
+        KeyError: If the format doesn't exist."""
+    try:
+        return _decodes[name]
+    except KeyError:
+        _load(name)
+        return _decodes[name]
+
+
+def get_encode(name: str) -> Optional[Callable]:
+    """Get the encode function of a format.
+
+    Args:
+        name (str): The name of the format.
+
+    Returns:
+        Optional[Callable]: The function, None if the format doesn't have one.
+
+    Raises:
+        KeyError: If the format doesn't exist."""
+    try:
+        return _encodes[name]
+    except KeyError:
+        _load(name)
+        return _encodes[name]
+
+
+def get_reencode(name: str) -> Optional[Callable]:
+    """Get the reencode function of a format.
+
+    Args:
+        name (str): The name of the format.
+
+    Returns:
+        Optional[Callable]: The function, None if the format doesn't have one.
+
+    Raises:
+        KeyError: If the format doesn't exist."""
+    try:
+        return _reencodes[name]
+    except KeyError:
+        _load(name)
+        return _reencodes[name]
+
+
+def _load(name: str) -> None:
+    if name not in _loaders:
+        _find_entry_points()
+    module = _loaders[name]()
+    _opens[name] = module.open
+    _saves[name] = module.save
+    _decodes[name] = getattr(module, "decode", None)
+    _encodes[name] = getattr(module, "encode", None)
+    _reencodes[name] = getattr(module, "reencode", None)
+
+
+def _find_entry_points() -> None:
+    global _found_entry_points
+    if _found_entry_points:
+        return
+    _found_entry_points = True
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python 3.7 and older
+        return
+
+    found = entry_points()
+    if hasattr(found, "select"):
+        found = found.select(group=ENTRY_POINT_GROUP)
+    else:
+        found = found.get(ENTRY_POINT_GROUP, [])
+
+    # Formats of this package and ones added with register come first
+    for entry_point in found:
+        _loaders.setdefault(entry_point.name, entry_point.load)
@@ -0,0 +1,740 @@
+"""This module contains the backends that store the cells of a level.
+
+Copies of a grid share their storage until it's written to, so cloning a level
+is cheap no matter how big it is.
+
+Grids also keep an index of the cells that aren't empty bgs, so levels that
+are mostly empty can skip the empty space. It's only made the first time it's
+needed, and writing cells keeps it up to date after that."""
+
+import re, sys
+from typing import List, Tuple
+from .level import Cell, _cells
+
+# Matches every cell that isn't an empty bg in cell codes
+_OCCUPIED = re.compile(rb"[^\x48]")
+
+# If every cell code is placeable
+_PLACES = [code % 2 == 1 for code in range(256)]
+
+
+def _update_occupied_row(occupied: set, start: int, codes: bytes) -> None:
+    # Keep the index of the cells that aren't empty bgs up to date after a row
+    # of cells starting at an index was written
+    occupied.difference_update(range(start, start + len(codes)))
+    occupied.update(start + match.start() for match in _OCCUPIED.finditer(codes))
+
+
+def _move_codes(width: int, height: int, codes: bytes, turns: int, mirror: bool):
+    # Mirror the cells left to right, then turn them clockwise, row y of a
+    # level turned once is column width - 1 - y from the bottom
+    if mirror:
+        codes = b"".join(
+            codes[y * width : (y + 1) * width][::-1] for y in range(height)
+        )
+    turns %= 4
+    if turns == 1:
+        codes = b"".join(codes[width - 1 - y :: width] for y in range(width))
+    elif turns == 2:
+        codes = codes[::-1]
+    elif turns == 3:
+        codes = b"".join(codes[y::width][::-1] for y in range(width))
+    return codes
+
+
+class ListGrid:
+    """The default backend, it stores a Cell and a bool for every cell. Copies
+    share rows, a row is copied the first time it's written to."""
+
+    name = "list"
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self._cell_rows = [[Cell()] * width for _ in range(height)]
+        self._place_rows = [[False] * width for _ in range(height)]
+        # If the rows at a y are only used by this grid and can be written to
+        self._owned = [True] * height
+        # If the rows were given out, then they can change at any time and
+        # copies can't share them
+        self._given_out = False
+        # The indexes of the cells that aren't empty bgs, None until needed
+        self._occupied = None
+
+    @classmethod
+    def from_codes(cls, width: int, height: int, codes: bytes) -> "ListGrid":
+        """Create a grid from cell codes.
+
+        Args:
+            width (int): The width of the grid.
+            height (int): The height of the grid.
+            codes (bytes): The code of every cell, row by row.
+
+        Returns:
+            ListGrid: The grid."""
+        grid = cls(0, 0)
+        grid.width = width
+        grid.height = height
+
+        cells = list(map(Cell.from_code, codes))
+        grid._cell_rows = [cells[y * width : (y + 1) * width] for y in range(height)]
+        grid._place_rows = [
+            [code % 2 == 1 for code in codes[y * width : (y + 1) * width]]
+            for y in range(height)
+        ]
+        grid._owned = [True] * height
+        return grid
+
+    def to_codes(self, start: int = 0) -> bytes:
+        """Get the code of every cell, row by row.
+
+        Args:
+            start (int): The index of the first cell to get.
+
+        Returns:
+            bytes: The cell codes."""
+        first_row = start // self.width if self.width else 0
+        codes = bytes(
+            cell.code + place
+            for cell_row, place_row in zip(
+                self._cell_rows[first_row:], self._place_rows[first_row:]
+            )
+            for cell, place in zip(cell_row, place_row)
+        )
+        return codes[start - first_row * self.width :]
+
+    def _own(self, y: int) -> None:
+        self._cell_rows[y] = self._cell_rows[y][:]
+        self._place_rows[y] = self._place_rows[y][:]
+        self._owned[y] = True
+
+    def get_cell(self, x: int, y: int) -> Cell:
+        """Get the cell at a position."""
+        return self._cell_rows[y][x]
+
+    def get_place(self, x: int, y: int) -> bool:
+        """Get if the cell at a position is placeable."""
+        return self._place_rows[y][x]
+
+    def get_row(self, y: int) -> Tuple[List[Cell], List[bool]]:
+        """Get a copy of the cells and placeables of a row."""
+        return self._cell_rows[y][:], self._place_rows[y][:]
+
+    def set_cell(self, x: int, y: int, cell: Cell) -> None:
+        """Set the cell at a position."""
+        if not self._owned[y]:
+            self._own(y)
+        self._cell_rows[y][x] = cell
+        if self._occupied is not None:
+            self._update_occupied(x, y)
+
+    def set_place(self, x: int, y: int, place: bool) -> None:
+        """Set if the cell at a position is placeable."""
+        if not self._owned[y]:
+            self._own(y)
+        self._place_rows[y][x] = place
+        if self._occupied is not None:
+            self._update_occupied(x, y)
+
+    def _update_occupied(self, x: int, y: int) -> None:
+        # Positions can be negative like list indexes, they're valid by now
+        index = y % self.height * self.width + x % self.width
+        if self._cell_rows[y][x].code != 72 or self._place_rows[y][x]:
+            self._occupied.add(index)
+        else:
+            self._occupied.discard(index)
+
+    def get_codes(self, indexes: List[int]) -> bytes:
+        """Get the codes of cells by their index."""
+        codes = self.to_codes()
+        return bytes(map(codes.__getitem__, indexes))
+
+    def get_rect(self, x: int, y: int, width: int, height: int) -> bytes:
+        """Get the codes of the cells in a rectangle, row by row. The
+        rectangle has to be inside the grid."""
+        return bytes(
+            cell.code + place
+            for cell_row, place_row in zip(
+                self._cell_rows[y : y + height], self._place_rows[y : y + height]
+            )
+            for cell, place in zip(cell_row[x : x + width], place_row[x : x + width])
+        )
+
+    def set_rect(self, x: int, y: int, width: int, height: int, codes: bytes) -> None:
+        """Set the codes of the cells in a rectangle, row by row. The
+        rectangle has to be inside the grid."""
+        for row_y in range(y, y + height):
+            if not self._owned[row_y]:
+                self._own(row_y)
+            row = codes[(row_y - y) * width : (row_y - y + 1) * width]
+            self._cell_rows[row_y][x : x + width] = map(_cells.__getitem__, row)
+            self._place_rows[row_y][x : x + width] = map(_PLACES.__getitem__, row)
+            if self._occupied is not None:
+                _update_occupied_row(self._occupied, row_y * self.width + x, row)
+
+    def occupied(self) -> List[int]:
+        """Get the cells that aren't empty bgs.
+
+        Returns:
+            List[int]: The indexes of the cells, in the order of to_codes."""
+        if self._given_out:
+            # The lists can change without the grid knowing, so nothing cached
+            # about them can be trusted
+            return [match.start() for match in _OCCUPIED.finditer(self.to_codes())]
+        if self._occupied is None:
+            self._occupied = {
+                match.start() for match in _OCCUPIED.finditer(self.to_codes())
+            }
+        return sorted(self._occupied)
+
+    def _own_all(self) -> None:
+        # The lists are about to be given out, so they can change at any time
+        for y in range(self.height):
+            if not self._owned[y]:
+                self._own(y)
+        self._given_out = True
+        self._occupied = None
+
+    @property
+    def cell_grid(self) -> List[List[Cell]]:
+        """List[List[Cell]]: The cells, row by row. The rows can be changed
+        directly, so none of them is shared after getting this."""
+        self._own_all()
+        return self._cell_rows
+
+    @cell_grid.setter
+    def cell_grid(self, value: List[List[Cell]]) -> None:
+        self._own_all()
+        self._cell_rows = value
+
+    @property
+    def place_grid(self) -> List[List[bool]]:
+        """List[List[bool]]: If the cells are placeable, row by row. The rows
+        can be changed directly, so none of them is shared after getting this."""
+        self._own_all()
+        return self._place_rows
+
+    @place_grid.setter
+    def place_grid(self, value: List[List[bool]]) -> None:
+        self._own_all()
+        self._place_rows = value
+
+    @property
+    def nbytes(self) -> int:
+        """int: Roughly how many bytes the cells take, the Cells themselves are
+        shared by every grid so they aren't counted."""
+        return sum(map(sys.getsizeof, self._cell_rows)) + sum(
+            map(sys.getsizeof, self._place_rows)
+        )
+
+    def copy(self) -> "ListGrid":
+        """Copy the grid, both grids share the rows until they're written to,
+        unless the rows were given out.
+
+        Returns:
+            ListGrid: The copy."""
+        grid = ListGrid(0, 0)
+        grid.width = self.width
+        grid.height = self.height
+        if self._given_out:
+            grid._cell_rows = [row[:] for row in self._cell_rows]
+            grid._place_rows = [row[:] for row in self._place_rows]
+            grid._owned = [True] * self.height
+        else:
+            grid._cell_rows = self._cell_rows[:]
+            grid._place_rows = self._place_rows[:]
+            grid._owned = [False] * self.height
+            self._owned = [False] * self.height
+        if self._occupied is not None:
+            grid._occupied = set(self._occupied)
+        return grid
+
+    def resize(
+        self, add_left: int, add_right: int, add_top: int, add_bottom: int
+    ) -> None:
+        """Add bg cells around the grid, see Level.resize."""
+        self.width += add_left + add_right
+        self.height += add_top + add_bottom
+
+        # Widening makes new rows, so they don't have to be copied
+        if add_left or add_right:
+            self._cell_rows = [
+                [Cell()] * add_left + row + [Cell()] * add_right
+                for row in self._cell_rows
+            ]
+            self._place_rows = [
+                [False] * add_left + row + [False] * add_right
+                for row in self._place_rows
+            ]
+            self._owned = [True] * len(self._owned)
+            self._given_out = False
+
+        self._cell_rows = (
+            [[Cell()] * self.width for _ in range(add_bottom)]
+            + self._cell_rows
+            + [[Cell()] * self.width for _ in range(add_top)]
+        )
+        self._place_rows = (
+            [[False] * self.width for _ in range(add_bottom)]
+            + self._place_rows
+            + [[False] * self.width for _ in range(add_top)]
+        )
+        self._owned = [True] * add_bottom + self._owned + [True] * add_top
+        self._occupied = None
+
+    def transform(self, table: bytes, turns: int = 0, mirror: bool = False) -> None:
+        """Change every cell at once, see Level.rotate.
+
+        Args:
+            table (bytes): The new code of every cell code, for bytes.translate.
+            turns (int): How many times to turn the grid clockwise.
+            mirror (bool): If the grid is mirrored left to right before it's
+                turned."""
+        codes = _move_codes(
+            self.width, self.height, self.to_codes(), turns, mirror
+        ).translate(table)
+        if turns % 2 == 1:
+            self.width, self.height = self.height, self.width
+        grid = ListGrid.from_codes(self.width, self.height, codes)
+        self._cell_rows = grid._cell_rows
+        self._place_rows = grid._place_rows
+        self._owned = grid._owned
+        self._given_out = False
+        self._occupied = None
+
+
+class PackedGrid:
+    """The compact backend, it stores the code of every cell in one bytearray,
+    which takes a single byte per cell. Copies share the bytearray, it's copied
+    the first time it's written to, which is a single memory copy."""
+
+    name = "packed"
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self._codes = bytearray(b"\x48") * (width * height)
+        # If the bytearray is only used by this grid and can be written to
+        self._owned = True
+        # The indexes of the cells that aren't empty bgs, None until needed
+        self._occupied = None
+
+    @classmethod
+    def from_codes(cls, width: int, height: int, codes: bytes) -> "PackedGrid":
+        """Create a grid from cell codes.
+
+        Args:
+            width (int): The width of the grid.
+            height (int): The height of the grid.
+            codes (bytes): The code of every cell, row by row.
+
+        Returns:
+            PackedGrid: The grid."""
+        grid = cls(0, 0)
+        grid.width = width
+        grid.height = height
+        grid._codes = bytearray(codes)
+        return grid
+
+    def to_codes(self, start: int = 0) -> bytes:
+        """Get the code of every cell, row by row.
+
+        Args:
+            start (int): The index of the first cell to get.
+
+        Returns:
+            bytes: The cell codes."""
+        return bytes(memoryview(self._codes)[start:])
+
+    def _index(self, x: int, y: int) -> int:
+        # Negative positions count from the end, like they do for lists
+        if x < 0:
+            x += self.width
+        if y < 0:
+            y += self.height
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f"Position {x}, {y} is outside of the level.")
+        return y * self.width + x
+
+    def _own(self) -> None:
+        self._codes = self._codes[:]
+        self._owned = True
+
+    def get_cell(self, x: int, y: int) -> Cell:
+        """Get the cell at a position."""
+        return Cell.from_code(self._codes[self._index(x, y)])
+
+    def get_place(self, x: int, y: int) -> bool:
+        """Get if the cell at a position is placeable."""
+        return self._codes[self._index(x, y)] % 2 == 1
+
+    def get_row(self, y: int) -> Tuple[List[Cell], List[bool]]:
+        """Get a copy of the cells and placeables of a row."""
+        start = self._index(0, y)
+        codes = self._codes[start : start + self.width]
+        return list(map(Cell.from_code, codes)), [code % 2 == 1 for code in codes]
+
+    def set_cell(self, x: int, y: int, cell: Cell) -> None:
+        """Set the cell at a position."""
+        index = self._index(x, y)
+        if not self._owned:
+            self._own()
+        self._codes[index] = cell.code + self._codes[index] % 2
+        if self._occupied is not None:
+            self._update_occupied(index)
+
+    def set_place(self, x: int, y: int, place: bool) -> None:
+        """Set if the cell at a position is placeable."""
+        index = self._index(x, y)
+        if not self._owned:
+            self._own()
+        self._codes[index] = self._codes[index] - self._codes[index] % 2 + place
+        if self._occupied is not None:
+            self._update_occupied(index)
+
+    def _update_occupied(self, index: int) -> None:
+        if self._codes[index] != 72:
+            self._occupied.add(index)
+        else:
+            self._occupied.discard(index)
+
+    def get_codes(self, indexes: List[int]) -> bytes:
+        """Get the codes of cells by their index."""
+        return bytes(map(self._codes.__getitem__, indexes))
+
+    def get_rect(self, x: int, y: int, width: int, height: int) -> bytes:
+        """Get the codes of the cells in a rectangle, see ListGrid.get_rect."""
+        if width == self.width:
+            return bytes(self._codes[y * width : (y + height) * width])
+        return b"".join(
+            self._codes[start : start + width]
+            for start in range(
+                y * self.width + x, (y + height) * self.width, self.width
+            )
+        )
+
+    def set_rect(self, x: int, y: int, width: int, height: int, codes: bytes) -> None:
+        """Set the codes of the cells in a rectangle, see ListGrid.set_rect."""
+        if not self._owned:
+            self._own()
+        for row_y in range(y, y + height):
+            start = row_y * self.width + x
+            row = codes[(row_y - y) * width : (row_y - y + 1) * width]
+            self._codes[start : start + width] = row
+            if self._occupied is not None:
+                _update_occupied_row(self._occupied, start, row)
+
+    def occupied(self) -> List[int]:
+        """Get the cells that aren't empty bgs.
+
+        Returns:
+            List[int]: The indexes of the cells, in the order of to_codes."""
+        if self._occupied is None:
+            self._occupied = {
+                match.start() for match in _OCCUPIED.finditer(self._codes)
+            }
+        return sorted(self._occupied)
+
+    @property
+    def cell_grid(self) -> List[List[Cell]]:
+        """List[List[Cell]]: A copy of the cells, row by row."""
+        width = self.width
+        return [
+            [Cell.from_code(code) for code in self._codes[y * width : (y + 1) * width]]
+            for y in range(self.height)
+        ]
+
+    @property
+    def place_grid(self) -> List[List[bool]]:
+        """List[List[bool]]: A copy of the placeables, row by row."""
+        width = self.width
+        return [
+            [code % 2 == 1 for code in self._codes[y * width : (y + 1) * width]]
+            for y in range(self.height)
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        """int: How many bytes the cells take."""
+        return sys.getsizeof(self._codes)
+
+    def copy(self) -> "PackedGrid":
+        """Copy the grid, both grids share the codes until they're written to.
+
+        Returns:
+            PackedGrid: The copy."""
+        grid = PackedGrid(0, 0)
+        grid.width = self.width
+        grid.height = self.height
+        grid._codes = self._codes
+        grid._owned = self._owned = False
+        if self._occupied is not None:
+            grid._occupied = set(self._occupied)
+        return grid
+
+    def resize(
+        self, add_left: int, add_right: int, add_top: int, add_bottom: int
+    ) -> None:
+        """Add bg cells around the grid, see Level.resize."""
+        width = self.width + add_left + add_right
+
+        codes = bytearray(b"\x48") * (width * add_bottom)
+        for y in range(self.height):
+            codes += b"\x48" * add_left
+            codes += self._codes[y * self.width : (y + 1) * self.width]
+            codes += b"\x48" * add_right
+        codes += b"\x48" * (width * add_top)
+
+        self.width = width
+        self.height += add_top + add_bottom
+        self._codes = codes
+        self._owned = True
+        self._occupied = None
+
+    def transform(self, table: bytes, turns: int = 0, mirror: bool = False) -> None:
+        """Change every cell at once, see ListGrid.transform."""
+        self._codes = bytearray(
+            _move_codes(self.width, self.height, self._codes, turns, mirror)
+        ).translate(table)
+        if turns % 2 == 1:
+            self.width, self.height = self.height, self.width
+        self._owned = True
+        self._occupied = None
+
+
+class SparseGrid:
+    """The backend for big, mostly empty levels, it stores the codes of the
+    cells that aren't bgs in a dict and the placeable cells in a set, so it
+    takes memory for what's in the level instead of for its size. Copies share
+    both until they're written to."""
+
+    name = "sparse"
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        # Cell codes without the placeable bit, by index
+        self._cells = {}
+        self._places = set()
+        # If the dict and set are only used by this grid and can be written to
+        self._owned = True
+
+    @classmethod
+    def from_codes(cls, width: int, height: int, codes: bytes) -> "SparseGrid":
+        """Create a grid from cell codes.
+
+        Args:
+            width (int): The width of the grid.
+            height (int): The height of the grid.
+            codes (bytes): The code of every cell, row by row.
+
+        Returns:
+            SparseGrid: The grid."""
+        grid = cls(width, height)
+        for match in _OCCUPIED.finditer(codes):
+            index = match.start()
+            code = codes[index]
+            if code < 72:
+                grid._cells[index] = code - code % 2
+            if code % 2 == 1:
+                grid._places.add(index)
+        return grid
+
+    def to_codes(self, start: int = 0) -> bytes:
+        """Get the code of every cell, row by row.
+
+        Args:
+            start (int): The index of the first cell to get.
+
+        Returns:
+            bytes: The cell codes."""
+        codes = bytearray(b"\x48") * (self.width * self.height - start)
+        for index, code in self._cells.items():
+            if index >= start:
+                codes[index - start] = code
+        for index in self._places:
+            if index >= start:
+                codes[index - start] += 1
+        return bytes(codes)
+
+    # Positions are checked the same way as the packed backend checks them
+    _index = PackedGrid._index
+
+    def _own(self) -> None:
+        self._cells = self._cells.copy()
+        self._places = self._places.copy()
+        self._owned = True
+
+    def get_cell(self, x: int, y: int) -> Cell:
+        """Get the cell at a position."""
+        return Cell.from_code(self._cells.get(self._index(x, y), 72))
+
+    def get_place(self, x: int, y: int) -> bool:
+        """Get if the cell at a position is placeable."""
+        return self._index(x, y) in self._places
+
+    def get_row(self, y: int) -> Tuple[List[Cell], List[bool]]:
+        """Get a copy of the cells and placeables of a row."""
+        start = self._index(0, y)
+        indexes = range(start, start + self.width)
+        cells = [Cell.from_code(self._cells.get(index, 72)) for index in indexes]
+        return cells, [index in self._places for index in indexes]
+
+    def set_cell(self, x: int, y: int, cell: Cell) -> None:
+        """Set the cell at a position."""
+        index = self._index(x, y)
+        if not self._owned:
+            self._own()
+        if cell.code == 72:
+            self._cells.pop(index, None)
+        else:
+            self._cells[index] = cell.code
+
+    def set_place(self, x: int, y: int, place: bool) -> None:
+        """Set if the cell at a position is placeable."""
+        index = self._index(x, y)
+        if not self._owned:
+            self._own()
+        if place:
+            self._places.add(index)
+        else:
+            self._places.discard(index)
+
+    def get_codes(self, indexes: List[int]) -> bytes:
+        """Get the codes of cells by their index."""
+        return bytes(
+            self._cells.get(index, 72) + (index in self._places) for index in indexes
+        )
+
+    def _rect_indexes(self, x: int, y: int, width: int, height: int) -> List[int]:
+        # The stored cells in a rectangle, found from whichever is smaller
+        if len(self._cells) + len(self._places) < width * height:
+            return [
+                index
+                for index in self._places.union(self._cells)
+                if x <= index % self.width < x + width
+                and y <= index // self.width < y + height
+            ]
+        return [
+            index
+            for row_y in range(y, y + height)
+            for index in range(row_y * self.width + x, row_y * self.width + x + width)
+            if index in self._cells or index in self._places
+        ]
+
+    def get_rect(self, x: int, y: int, width: int, height: int) -> bytes:
+        """Get the codes of the cells in a rectangle, see ListGrid.get_rect."""
+        codes = bytearray(b"\x48") * (width * height)
+        for index in self._rect_indexes(x, y, width, height):
+            row_y, row_x = divmod(index, self.width)
+            codes[(row_y - y) * width + row_x - x] = self._cells.get(index, 72) + (
+                index in self._places
+            )
+        return bytes(codes)
+
+    def set_rect(self, x: int, y: int, width: int, height: int, codes: bytes) -> None:
+        """Set the codes of the cells in a rectangle, see ListGrid.set_rect."""
+        if not self._owned:
+            self._own()
+        for index in self._rect_indexes(x, y, width, height):
+            self._cells.pop(index, None)
+            self._places.discard(index)
+        for match in _OCCUPIED.finditer(codes):
+            row_y, row_x = divmod(match.start(), width)
+            index = (y + row_y) * self.width + x + row_x
+            code = codes[match.start()]
+            if code < 72:
+                self._cells[index] = code - code % 2
+            if code % 2 == 1:
+                self._places.add(index)
+
+    def occupied(self) -> List[int]:
+        """Get the cells that aren't empty bgs.
+
+        Returns:
+            List[int]: The indexes of the cells, in the order of to_codes."""
+        return sorted(self._places.union(self._cells))
+
+    @property
+    def cell_grid(self) -> List[List[Cell]]:
+        """List[List[Cell]]: A copy of the cells, row by row."""
+        return [self.get_row(y)[0] for y in range(self.height)]
+
+    @property
+    def place_grid(self) -> List[List[bool]]:
+        """List[List[bool]]: A copy of the placeables, row by row."""
+        return [self.get_row(y)[1] for y in range(self.height)]
+
+    @property
+    def nbytes(self) -> int:
+        """int: Roughly how many bytes the cells take."""
+        return sys.getsizeof(self._cells) + sys.getsizeof(self._places)
+
+    def copy(self) -> "SparseGrid":
+        """Copy the grid, both grids share the cells until they're written to.
+
+        Returns:
+            SparseGrid: The copy."""
+        grid = SparseGrid(self.width, self.height)
+        grid._cells = self._cells
+        grid._places = self._places
+        grid._owned = self._owned = False
+        return grid
+
+    def resize(
+        self, add_left: int, add_right: int, add_top: int, add_bottom: int
+    ) -> None:
+        """Add bg cells around the grid, see Level.resize."""
+        width = self.width + add_left + add_right
+
+        def moved(index: int) -> int:
+            return (index // self.width + add_bottom) * width + (
+                index % self.width + add_left
+            )
+
+        self._cells = {moved(index): code for index, code in self._cells.items()}
+        self._places = set(map(moved, self._places))
+        self._owned = True
+        self.width = width
+        self.height += add_top + add_bottom
+
+    def transform(self, table: bytes, turns: int = 0, mirror: bool = False) -> None:
+        """Change every cell at once, see ListGrid.transform."""
+        width, height = self.width, self.height
+        if table[72] != 72 or table[73] != 73:
+            # Empty cells don't stay empty, so every cell is stored anyway
+            grid = SparseGrid.from_codes(
+                width, height, self.to_codes().translate(table)
+            )
+            self._cells, self._places = grid._cells, grid._places
+            table = bytes(range(256))
+
+        def moved(index: int) -> int:
+            x, y = index % width, index // width
+            if mirror:
+                x = width - 1 - x
+            if turns % 4 == 1:
+                return (width - 1 - x) * height + y
+            if turns % 4 == 2:
+                return (height - 1 - y) * width + width - 1 - x
+            if turns % 4 == 3:
+                return x * height + height - 1 - y
+            return y * width + x
+
+        # The placeable bit is kept by the table, so it's translated separately
+        self._cells = {
+            moved(index): table[code]
+            for index, code in self._cells.items()
+            if table[code] != 72
+        }
+        self._places = set(map(moved, self._places))
+        self._owned = True
+        if turns % 2 == 1:
+            self.width, self.height = height, width
+
+
+backends = {
+    ListGrid.name: ListGrid,
+    PackedGrid.name: PackedGrid,
+    SparseGrid.name: SparseGrid,
+}
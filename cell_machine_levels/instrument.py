@@ -0,0 +1,156 @@
+"""This module measures where the time goes when levels are opened and saved.
+
+Nothing is measured until a Profile is started, then the formats time every
+phase of opening and saving levels and count what they did, like the cells
+decoded and the bytes read and written:
+
+    with instrument.Profile() as profile:
+        level.open(level_code).save("V3")
+    print(profile.report())
+
+While no Profile is started, every place that measures only checks if the
+active global is None, so it can be left in for production. A started Profile
+measures every thread, and Profiles can be merged, for example the ones from
+worker processes."""
+
+import threading, time
+from collections import defaultdict
+from typing import Dict, Optional
+
+# The Profile that's measuring, None when nothing is
+active: Optional["Profile"] = None
+clock = time.perf_counter
+
+
+class Timer:
+    """Times phases that run one after another, see Profile.timer."""
+
+    __slots__ = ("_profile", "_name", "_last")
+
+    def __init__(self, profile: "Profile", name: str) -> None:
+        self._profile = profile
+        self._name = name
+        self._last = clock()
+
+    def __call__(self, phase: str) -> None:
+        """End a phase, it started when the last one ended.
+
+        Args:
+            phase (str): The name of the phase."""
+        now = clock()
+        self._profile.add_time(f"{self._name} {phase}", now - self._last)
+        self._last = now
+
+
+class Profile:
+    """The times and counts measured while the profile is started. It can be
+    used as a context manager, which starts and stops it."""
+
+    def __init__(self) -> None:
+        # Seconds spent and times run of every phase, and every counter
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counts: Dict[str, int] = defaultdict(int)
+        # Threads add to the same counters
+        self._lock = threading.Lock()
+        # The profile that was active before this one started
+        self._previous: Optional[Profile] = None
+
+    def start(self) -> None:
+        """Start measuring, until stop is called."""
+        global active
+        self._previous = active
+        active = self
+
+    def stop(self) -> None:
+        """Stop measuring, the profile that was measuring before this one
+        started measures again."""
+        global active
+        active = self._previous
+        self._previous = None
+
+    def __enter__(self) -> "Profile":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def timer(self, name: str) -> Timer:
+        """Get a timer for phases of something, starting now.
+
+        Args:
+            name (str): What's being timed, the phases are named after it.
+
+        Returns:
+            Timer: The timer."""
+        return Timer(self, name)
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        """Add a run of a phase.
+
+        Args:
+            phase (str): The name of the phase.
+            seconds (float): How long it took."""
+        with self._lock:
+            self.times[phase] += seconds
+            self.calls[phase] += 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add to a counter.
+
+        Args:
+            name (str): The name of the counter.
+            amount (int): How much to add."""
+        with self._lock:
+            self.counts[name] += amount
+
+    def merge(self, other: "Profile") -> None:
+        """Add what another profile measured to this one.
+
+        Args:
+            other (Profile): The other profile."""
+        state = other.__getstate__()
+        with self._lock:
+            for phase, seconds in state["times"].items():
+                self.times[phase] += seconds
+            for phase, calls in state["calls"].items():
+                self.calls[phase] += calls
+            for name, amount in state["counts"].items():
+                self.counts[name] += amount
+
+    def __getstate__(self) -> dict:
+        # Worker processes send their profiles back, without what's active
+        with self._lock:
+            return {
+                "times": dict(self.times),
+                "calls": dict(self.calls),
+                "counts": dict(self.counts),
+            }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.times.update(state["times"])
+        self.calls.update(state["calls"])
+        self.counts.update(state["counts"])
+
+    def report(self) -> str:
+        """Get a table of the phases, slowest first, and the counters.
+
+        Returns:
+            str: The table."""
+        # Other threads can add phases while the table is made
+        state = self.__getstate__()
+        times, phase_calls, counts = state["times"], state["calls"], state["counts"]
+
+        lines = [f"{'phase':<32} {'calls':>9} {'total ms':>11} {'per call us':>12}"]
+        for phase in sorted(times, key=times.__getitem__, reverse=True):
+            seconds, calls = times[phase], phase_calls[phase]
+            lines.append(
+                f"{phase:<32} {calls:>9} {seconds * 1e3:>11.3f} {seconds * 1e6 / calls:>12.3f}"
+            )
+        lines.append("")
+        lines.append(f"{'counter':<32} {'amount':>9}")
+        for name in sorted(counts):
+            lines.append(f"{name:<32} {counts[name]:>9}")
+        return "\n".join(lines)
@@ -1,10 +1,19 @@
 """This module contains the level class and the cell class."""
 
-import copy
-import importlib
+import functools, importlib, operator
+from concurrent.futures import Executor
 from enum import IntEnum
-from typing import Tuple, Union
-from . import _plugins
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+    Union,
+)
+from . import formats, instrument
 
 
 class CellEnum(IntEnum):
@@ -42,27 +51,71 @@ class WallEffect(IntEnum):
 
 
 class Cell:
-    """The class used for cells in the Level class."""
+    """The class used for cells in the Level class. Cells can't be changed and
+    there is only one of every cell, so Cell(type, rotation) always gives back
+    the same object. Use MutableCell for a cell that can be changed."""
+
+    __slots__ = ("_type", "_rotation")
+
+    def __new__(
+        cls, type: CellEnum = CellEnum.bg, rotation: Rotation = Rotation.right
+    ) -> "Cell":
+        if not 0 <= type <= CellEnum.bg:
+            raise ValueError(f"Invalid cell type {type}.")
+        if type == CellEnum.bg:
+            return _cells[72]
+        return _cells[type * 2 + rotation % 4 * 18]
+
+    @classmethod
+    def _create(cls, type: CellEnum, rotation: Rotation) -> "Cell":
+        cell = object.__new__(cls)
+        cell._type = CellEnum(type)
+        cell._rotation = Rotation(rotation) if type != CellEnum.bg else Rotation.right
+        return cell
+
+    def rotate_left(self) -> "Cell":
+        """Get this cell rotated left.
 
-    def __init__(
-        self, type: CellEnum = CellEnum.bg, rotation: Rotation = Rotation.right
-    ) -> None:
-        self.type = type
-        self._rotation = rotation if type != CellEnum.bg else Rotation.right
+        Returns:
+            Cell: The rotated cell."""
+        return Cell(self.type, self.rotation - 1)
 
-    def rotate_left(self) -> None:
-        """Rotate the cell left."""
-        self.rotation = (self.rotation - 1) % 4
+    def rotate_right(self) -> "Cell":
+        """Get this cell rotated right.
 
-    def rotate_right(self) -> None:
-        """Rotate the cell right."""
-        self.rotation = (self.rotation + 1) % 4
+        Returns:
+            Cell: The rotated cell."""
+        return Cell(self.type, self.rotation + 1)
+
+    @classmethod
+    def from_code(cls, code: int) -> "Cell":
+        """Get the cell with a cell code, the placeable bit is ignored.
+
+        Args:
+            code (int): The cell code.
+
+        Returns:
+            Cell: The cell."""
+        return _cells[code]
+
+    @property
+    def code(self) -> int:
+        """int: The cell code of the cell, add 1 for placeable cells. It's
+        type * 2 + rotation * 18, or 72 for bgs."""
+        if self.type == CellEnum.bg:
+            return 72
+        return self.type * 2 + self.rotation * 18
 
     def __str__(self) -> str:
         return f"{self.type}:{self.rotation}"
 
     __repr__ = __str__
 
+    @property
+    def type(self) -> CellEnum:
+        """CellEnum: The type of the cell."""
+        return self._type
+
     @property
     def rotation(self) -> Rotation:
         """Get the rotation of the cell.
@@ -71,14 +124,16 @@ class Cell:
             Rotation: The rotation of the cell."""
         return self._rotation
 
-    @rotation.setter
-    def rotation(self, value: Rotation) -> None:
-        """Set the rotation of the cell.
+    # Copying and pickling gives back the same cell
 
-        Args:
-            value (Rotation): The rotation to set the cell to."""
-        if self.type != CellEnum.bg:
-            self._rotation = value % 4
+    def __copy__(self) -> "Cell":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "Cell":
+        return self
+
+    def __reduce__(self) -> tuple:
+        return type(self), (int(self.type), int(self.rotation))
 
     # Comparisons
 
@@ -97,6 +152,124 @@ class Cell:
             return str(self) == other
         raise TypeError(f"Cannot compare Cell to {type(other)}.")
 
+    def __hash__(self) -> int:
+        return hash(self.code)
+
+
+# Every cell indexed by its cell code, a placeable code gives the same cell
+_cells = [Cell._create(code // 2 % 9, code // 18) for code in range(0, 72, 2)] + [
+    Cell._create(CellEnum.bg, Rotation.right)
+]
+_cells = [cell for cell in _cells for _ in range(2)]
+
+
+def _code_table(function: Callable[[int, int], Tuple[int, int]]) -> bytes:
+    # A table for bytes.translate from a function of the type and rotation of
+    # a cell, the placeable bit and bgs stay the same
+    table = bytearray(range(256))
+    for code in range(72):
+        cell_type, rotation = function(code // 2 % 9, code // 18)
+        table[code] = cell_type * 2 + rotation % 4 * 18 + code % 2
+    return bytes(table)
+
+
+def _optimize_cell(cell_type: int, rotation: int) -> Tuple[int, int]:
+    # Rotations that don't change what a cell does are made the same
+    if cell_type == CellEnum.slide:
+        return cell_type, rotation % 2
+    if cell_type in (
+        CellEnum.spinner_right,
+        CellEnum.spinner_left,
+        CellEnum.push,
+        CellEnum.immobile,
+        CellEnum.enemy,
+        CellEnum.trash,
+    ):
+        return cell_type, 0
+    return cell_type, rotation
+
+
+def _mirror_cell(cell_type: int, rotation: int) -> Tuple[int, int]:
+    # Mirrored cells point the other way left and right, and spinners spin the
+    # other way
+    if cell_type == CellEnum.spinner_right:
+        cell_type = CellEnum.spinner_left
+    elif cell_type == CellEnum.spinner_left:
+        cell_type = CellEnum.spinner_right
+    return cell_type, (rotation + 2) % 4 if rotation % 2 == 0 else rotation
+
+
+_OPTIMIZE_TABLE = _code_table(_optimize_cell)
+_MIRROR_TABLE = _code_table(_mirror_cell)
+# The table for turning cells clockwise 0 to 3 times
+_TURN_TABLES = [
+    _code_table(lambda cell_type, rotation, turns=turns: (cell_type, rotation + turns))
+    for turns in range(4)
+]
+
+
+class MutableCell(Cell):
+    """A cell that can be changed, the way cells used to work. Levels store the
+    Cell with the same type and rotation instead of the MutableCell itself."""
+
+    __slots__ = ()
+
+    def __new__(
+        cls, type: CellEnum = CellEnum.bg, rotation: Rotation = Rotation.right
+    ) -> "MutableCell":
+        return cls._create(type, rotation % 4)
+
+    def rotate_left(self) -> None:
+        """Rotate the cell left."""
+        self.rotation = (self.rotation - 1) % 4
+
+    def rotate_right(self) -> None:
+        """Rotate the cell right."""
+        self.rotation = (self.rotation + 1) % 4
+
+    def frozen(self) -> Cell:
+        """Get the Cell with the same type and rotation.
+
+        Returns:
+            Cell: The cell."""
+        return Cell(self.type, self.rotation)
+
+    @property
+    def type(self) -> CellEnum:
+        """CellEnum: The type of the cell."""
+        return self._type
+
+    @type.setter
+    def type(self, value: CellEnum) -> None:
+        self._type = CellEnum(value)
+        if self._type == CellEnum.bg:
+            self._rotation = Rotation.right
+
+    @property
+    def rotation(self) -> Rotation:
+        """Get the rotation of the cell.
+
+        Returns:
+            Rotation: The rotation of the cell."""
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, value: Rotation) -> None:
+        """Set the rotation of the cell.
+
+        Args:
+            value (Rotation): The rotation to set the cell to."""
+        if self.type != CellEnum.bg:
+            self._rotation = Rotation(value % 4)
+
+    def __copy__(self) -> "MutableCell":
+        return MutableCell(self.type, self.rotation)
+
+    def __deepcopy__(self, memo: dict) -> "MutableCell":
+        return MutableCell(self.type, self.rotation)
+
+    __hash__ = None
+
 
 class Level:
     """The main class for levels. You can use this class to create levels
@@ -109,14 +282,106 @@ class Level:
         tutorial_text: str = "",
         name: str = "",
         wall_effect: WallEffect = 0,
+        backend: str = "list",
+        track_saves: bool = False,
     ) -> None:
+        if backend is None:
+            backend = "list"
+        if backend not in backends:
+            raise ValueError(f"The backend {backend} doesn't exist.")
+
         self._size = (width, height)
-        self.cell_grid = [[Cell() for _ in range(width)] for _ in range(height)]
-        self.place_grid = [[False for _ in range(width)] for _ in range(height)]
+        self._grid = backends[backend](width, height)
         self.tutorial_text = tutorial_text
         self.name = name
         self.wall_effect = wall_effect
-        self._pos = None  # Cause pylint is complaining
+
+        # The cell codes, reencode state, first changed cell, other fields and
+        # level code of the last save in every format. The cell codes and
+        # reencode state are only kept if track_saves is on, None otherwise
+        self._saves = {}
+        self._track_saves = track_saves
+        # If every change to the cells goes through the level
+        self._tracked = True
+        # The hash of the cells, None until it's needed, see __hash__
+        self._hash = None
+
+    @classmethod
+    def from_codes(
+        cls,
+        width: int,
+        height: int,
+        codes: bytes,
+        tutorial_text: str = "",
+        name: str = "",
+        wall_effect: WallEffect = 0,
+        backend: str = "list",
+    ) -> "Level":
+        """Create a level from cell codes, the numbers V2 and V3 use for cells.
+
+        Args:
+            width (int): The width of the level.
+            height (int): The height of the level.
+            codes (bytes): The code of every cell, row by row. A code is
+                type * 2 + rotation * 18 + place, or 72 + place for bgs.
+            tutorial_text (str): The tutorial text of the level.
+            name (str): The name of the level.
+            wall_effect (WallEffect): The wall effect of the level.
+            backend (str): The backend to store the cells with.
+
+        Returns:
+            Level: The level.
+
+        Raises:
+            ValueError: If there isn't a code for every cell or the backend
+                doesn't exist."""
+        if len(codes) != width * height:
+            raise ValueError(
+                f"Expected {width * height} cell codes, got {len(codes)} instead."
+            )
+
+        level = cls(0, 0, tutorial_text, name, wall_effect, backend)
+        level._size = (width, height)
+        level._grid = backends[level.backend].from_codes(width, height, codes)
+        return level
+
+    def to_codes(self) -> bytes:
+        """Get the cell code of every cell, see Level.from_codes.
+
+        Returns:
+            bytes: The cell codes, row by row."""
+        return self._grid.to_codes()
+
+    def set_codes(self, codes: bytes) -> None:
+        """Set the cell code of every cell at once, see Level.from_codes.
+
+        Args:
+            codes (bytes): The code of every cell, row by row.
+
+        Raises:
+            ValueError: If there isn't a code for every cell."""
+        width, height = self._size
+        if len(codes) != width * height:
+            raise ValueError(
+                f"Expected {width * height} cell codes, got {len(codes)} instead."
+            )
+
+        self._grid = backends[self.backend].from_codes(width, height, codes)
+        self._saves.clear()
+        self._tracked = True
+        self._hash = None
+
+    def step(self, ticks: int = 1) -> None:
+        """Advance the level like Cell Machine does, see simulate.Simulation
+        to keep simulating without writing the level every time. Once the
+        cells repeat, the rest of the ticks are skipped a cycle at a time.
+
+        Args:
+            ticks (int): The amount of ticks to advance by."""
+        simulate = importlib.import_module(".simulate", "cell_machine_levels")
+        simulation = simulate.Simulation(self)
+        simulation.run(ticks)
+        simulation.apply(self)
 
     def optimized(self) -> "Level":
         """Optimize the level.
@@ -128,23 +393,96 @@ class Level:
         return result
 
     def optimize(self) -> None:
-        """Optimize this level without returning anything."""
-        for x, y, cell, place in self:
-            if cell.type in (
-                CellEnum.enemy,
-                CellEnum.immobile,
-                CellEnum.push,
-                CellEnum.trash,
-                CellEnum.spinner_left,
-                CellEnum.spinner_right,
-            ):
-                self[x, y] = Cell(cell.type, 0)
-            elif cell.type == CellEnum.slide:
-                self[x, y] = Cell(cell.type, cell.rotation % 2)
-            else:
-                self[x, y] = cell
+        """Optimize this level without returning anything. Cells whose
+        rotation doesn't change what they do are given the same rotation."""
+        self._transform(_OPTIMIZE_TABLE)
+
+    def rotated(self, turns: int = 1) -> "Level":
+        """Rotate the level.
 
-            self[x, y] = place
+        Args:
+            turns (int): How many times to turn the level right, negative
+                turns turn it left.
+
+        Returns:
+            Level: The rotated level."""
+        result = self.clone()
+        result.rotate(turns)
+        return result
+
+    def rotate(self, turns: int = 1) -> None:
+        """Rotate this level without returning anything, the cells are turned
+        with it.
+
+        Args:
+            turns (int): How many times to turn the level right, negative
+                turns turn it left."""
+        self._transform(_TURN_TABLES[turns % 4], turns)
+
+    def mirrored(self, vertical: bool = False) -> "Level":
+        """Mirror the level.
+
+        Args:
+            vertical (bool): If the level is mirrored top to bottom instead of
+                left to right.
+
+        Returns:
+            Level: The mirrored level."""
+        result = self.clone()
+        result.mirror(vertical)
+        return result
+
+    def mirror(self, vertical: bool = False) -> None:
+        """Mirror this level without returning anything, the cells are
+        mirrored with it, so spinners spin the other way.
+
+        Args:
+            vertical (bool): If the level is mirrored top to bottom instead of
+                left to right."""
+        if vertical:
+            # Top to bottom is left to right turned twice
+            self._transform(_MIRROR_TABLE.translate(_TURN_TABLES[2]), 2, True)
+        else:
+            self._transform(_MIRROR_TABLE, 0, True)
+
+    def remapped(self, types: Dict[CellEnum, CellEnum]) -> "Level":
+        """Change the types of the cells of the level.
+
+        Args:
+            types (Dict[CellEnum, CellEnum]): The new type of every type that's
+                changed. Cells keep their rotation and if they're placeable.
+
+        Returns:
+            Level: The changed level."""
+        result = self.clone()
+        result.remap(types)
+        return result
+
+    def remap(self, types: Dict[CellEnum, CellEnum]) -> None:
+        """Change the types of the cells of this level without returning
+        anything, see Level.remapped.
+
+        Args:
+            types (Dict[CellEnum, CellEnum]): The new type of every type that's
+                changed."""
+        table = bytearray(range(256))
+        for code in range(74):
+            cell = _cells[code]
+            cell_type = types.get(cell.type, cell.type)
+            if not 0 <= cell_type <= CellEnum.bg:
+                raise ValueError(f"Invalid cell type {cell_type}.")
+            table[code] = Cell(cell_type, cell.rotation).code + code % 2
+        self._transform(bytes(table))
+
+    def _transform(self, table: bytes, turns: int = 0, mirror: bool = False) -> None:
+        # Every cell is changed in one pass over the grid instead of a cell at
+        # a time, and the grid isn't shared with lists given out anymore
+        self._grid.transform(table, turns, mirror)
+        if turns % 2 == 1:
+            self._size = self._size[::-1]
+        self._saves.clear()
+        self._tracked = True
+        self._hash = None
 
     def resized(
         self, add_left: int, add_right: int, add_top: int, add_bottom: int
@@ -188,43 +526,93 @@ class Level:
             self.width + add_left + add_right,
             self.height + add_top + add_bottom,
         )
+        self._grid.resize(add_left, add_right, add_top, add_bottom)
+        self._saves.clear()
+        self._hash = None
 
-        for i in range(len(self.cell_grid, self.place_grid)):
-            self.cell_grid[i] = (
-                [Cell() for _ in range(add_left)]
-                + self.cell_grid[i]
-                + [Cell() for _ in range(add_right)]
-            )
-            self.place_grid[i] = (
-                [False for _ in range(add_left)]
-                + self.place_grid[i]
-                + [False for _ in range(add_right)]
+    def cropped(self, x: int, y: int, width: int, height: int) -> "Level":
+        """Crop the level.
+
+        Args:
+            x (int): The x of the left of the rectangle to crop to.
+            y (int): The y of the bottom of the rectangle to crop to.
+            width (int): The width of the rectangle.
+            height (int): The height of the rectangle.
+
+        Returns:
+            Level: The cropped level.
+
+        Raises:
+            ValueError: If the width or height is negative."""
+        result = self.clone()
+        result.crop(x, y, width, height)
+        return result
+
+    def crop(self, x: int, y: int, width: int, height: int) -> None:
+        """Crop this level without returning anything. The parts of the
+        rectangle outside of the level are filled with bgs, so it can pad the
+        level too.
+
+        Args:
+            x (int): The x of the left of the rectangle to crop to.
+            y (int): The y of the bottom of the rectangle to crop to.
+            width (int): The width of the rectangle.
+            height (int): The height of the rectangle.
+
+        Raises:
+            ValueError: If the width or height is negative."""
+        if width < 0 or height < 0:
+            raise ValueError("Cannot crop to a negative size.")
+
+        grid = backends[self.backend](width, height)
+        # The part of the rectangle inside the level is copied a row at a time
+        left, bottom = max(x, 0), max(y, 0)
+        right, top = min(x + width, self.width), min(y + height, self.height)
+        if left < right and bottom < top:
+            grid.set_rect(
+                left - x,
+                bottom - y,
+                right - left,
+                top - bottom,
+                self._grid.get_rect(left, bottom, right - left, top - bottom),
             )
 
-        self.cell_grid = (
-            [[Cell() for _ in range(self.width)] for _ in range(add_bottom)]
-            + self.cell_grid
-            + [[Cell() for _ in range(self.width)] for _ in range(add_top)]
-        )
-        self.place_grid = (
-            [[False for _ in range(self.width)] for _ in range(add_bottom)]
-            + self.place_grid
-            + [[False for _ in range(self.width)] for _ in range(add_top)]
-        )
+        self._size = (width, height)
+        self._grid = grid
+        self._saves.clear()
+        self._tracked = True
+        self._hash = None
 
     def clone(self) -> "Level":
-        """Clone this level.
+        """Clone this level. The clone shares the cells of this level until
+        one of them is changed, so cloning is cheap and copies what's changed.
 
         Returns:
             Level: The cloned level.
         """
-        output = Level(
-            self.width, self.height, self.tutorial_text, self.name, self.wall_effect
-        )
-        output.cell_grid = copy.deepcopy(self.cell_grid)
-        output.place_grid = copy.deepcopy(self.place_grid)
+        output = Level(0, 0, self.tutorial_text, self.name, self.wall_effect)
+        output._track_saves = self._track_saves
+        output._size = self._size
+        output._grid = self._grid.copy()
+        output._hash = self._hash
         return output
 
+    def __getstate__(self) -> dict:
+        # Cell codes pickle much smaller than the list and packed grids, and
+        # the saves are only for this level
+        state = self.__dict__.copy()
+        state["_saves"] = {}
+        if self.backend != "sparse":
+            state["_grid"] = (self.backend, self._grid.to_codes())
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if isinstance(self._grid, tuple):
+            backend, codes = self._grid
+            self._grid = backends[backend].from_codes(*self._size, codes)
+            self._tracked = True
+
     def __str__(self) -> str:
         output = [[] for _ in range(self.height)]
 
@@ -237,58 +625,162 @@ class Level:
 
     # Saving the level
 
-    def save(self, format: str) -> str:
+    def save(self, format: str, **options) -> str:
         """Save the level to a level code of the given format.
 
         Args:
             format (str): The format to save the level in.
+            **options: Options of the format, like effort for V3.
 
         Returns:
             str: The level code."""
-        if format in _plugins:
-            return importlib.import_module(f".{format}", "cell_machine_levels").save(
-                self
-            )
-        raise ValueError(f"The format {format} is not supported or doesn't exist.")
+        try:
+            save = formats.get_save(format)
+        except KeyError:
+            raise ValueError(
+                f"The format {format} is not supported or doesn't exist."
+            ) from None
+
+        # Saves with options are always made from scratch
+        if options or not self._tracked:
+            return save(self, **options)
+
+        # Nothing is encoded if the level didn't change since the last save
+        fields = (self.tutorial_text, self.name, int(self.wall_effect))
+        saved = self._saves.get(format)
+        profile = instrument.active
+        if (
+            saved is not None
+            and saved[2] == self.width * self.height
+            and saved[3] == fields
+        ):
+            if profile is not None:
+                profile.count("saves reused")
+            return saved[4]
+
+        # Without tracking only the level code is kept
+        reencode = formats.get_reencode(format) if self._track_saves else None
+        if reencode is None:
+            level_code = save(self)
+            self._saves[format] = [
+                None,
+                None,
+                self.width * self.height,
+                fields,
+                level_code,
+            ]
+            return level_code
+
+        # Only encode from the first cell that changed since the last save
+        if profile is not None:
+            timer = profile.timer("Level.save")
+        saved = self._saves.pop(format, None)
+        if saved is None or saved[0] is None:
+            saved = None
+            codes, state, start = self.to_codes(), None, 0
+        else:
+            codes, state, start = saved[:3]
+            if start < len(codes):
+                codes = codes[:start] + self._grid.to_codes(start)
+        if profile is not None:
+            timer("cells")
+            if saved is not None:
+                profile.count("saves resumed")
+                profile.count("cells kept", start)
+
+        level_code, state = reencode(
+            DecodedLevel(self.width, self.height, codes, *fields), start, state
+        )
+        self._saves[format] = [codes, state, len(codes), fields, level_code]
+        return level_code
 
     # Iterable methods
 
-    def __iter__(self) -> "Level":
-        self._pos = [0, 0]
-        return self
+    def __iter__(self) -> Iterator[Tuple[int, int, Cell, bool]]:
+        for y, cells, places in self.rows():
+            yield from zip(range(self.width), [y] * self.width, cells, places)
+
+    def rows(self) -> Iterator[Tuple[int, List[Cell], List[bool]]]:
+        """Iterate over the rows of the level, from the bottom.
+
+        Returns:
+            Iterator[Tuple[int, List[Cell], List[bool]]]: The y, cells and
+                placeables of every row, the lists are copies."""
+        for y in range(self.height):
+            yield (y, *self._grid.get_row(y))
+
+    def region(
+        self, x: int, y: int, width: int, height: int
+    ) -> Iterator[Tuple[int, int, Cell, bool]]:
+        """Iterate over the cells in a rectangle of the level, row by row.
+
+        Args:
+            x (int): The x of the left of the rectangle.
+            y (int): The y of the bottom of the rectangle.
+            width (int): The width of the rectangle.
+            height (int): The height of the rectangle.
+
+        Returns:
+            Iterator[Tuple[int, int, Cell, bool]]: The x, y, cell and if it's
+                placeable for every cell.
 
-    def __next__(self) -> Tuple[int, int, Cell, bool]:
-        if self._pos[1] < self.height:
-            ret = (
-                self._pos[0],
-                self._pos[1],
-                self.cell_grid[self._pos[1]][self._pos[0]],
-                self.place_grid[self._pos[1]][self._pos[0]],
+        Raises:
+            IndexError: If the rectangle isn't inside the level."""
+        _check_rect(self, x, y, width, height)
+
+        for row_y in range(y, y + height):
+            cells, places = self._grid.get_row(row_y)
+            yield from zip(
+                range(x, x + width),
+                [row_y] * width,
+                cells[x : x + width],
+                places[x : x + width],
             )
-            self._pos[0] += 1
-            if self._pos[0] >= self.width:
-                self._pos = [0, self._pos[1] + 1]
-            return ret
-        raise StopIteration
+
+    def occupied(self) -> Iterator[Tuple[int, int, Cell, bool]]:
+        """Iterate over the cells that aren't bgs or are placeable, in the same
+        order as iterating over the level. The level keeps track of them, so
+        empty space is skipped instead of checked.
+
+        Returns:
+            Iterator[Tuple[int, int, Cell, bool]]: The x, y, cell and if it's
+                placeable for every cell."""
+        width = self.width
+        for index in self._grid.occupied():
+            x, y = index % width, index // width
+            yield x, y, self._grid.get_cell(x, y), self._grid.get_place(x, y)
 
     # Getters and setters
 
-    def __getitem__(self, pos: Tuple[int, int, bool]) -> Union[Cell, bool]:
+    def __getitem__(
+        self, pos: Union[Tuple[int, int, bool], Tuple[slice, slice]]
+    ) -> Union[Cell, bool, "LevelView"]:
+        if isinstance(pos[0], slice):
+            return LevelView(self, *_slice_rect(pos, self.width, self.height))
         if pos[2]:
-            return self.place_grid[pos[1]][pos[0]]
-        return self.cell_grid[pos[1]][pos[0]]
+            return self._grid.get_place(pos[0], pos[1])
+        return self._grid.get_cell(pos[0], pos[1])
 
     def __setitem__(
-        self, pos: Tuple[int, int], value: Union[Cell, bool, Tuple[Cell, bool]]
+        self,
+        pos: Union[Tuple[int, int], Tuple[slice, slice]],
+        value: Union[Cell, bool, Tuple[Cell, bool], "Level", "LevelView"],
     ) -> None:
+        if isinstance(pos[0], slice):
+            self[pos].set(value)
+            return
+
+        if self._hash is not None:
+            old_code = self._code(pos[0], pos[1])
+
         if isinstance(value, bool):
-            self.place_grid[pos[1]][pos[0]] = value
+            self._grid.set_place(pos[0], pos[1], value)
         elif isinstance(value, Cell):
-            self.cell_grid[pos[1]][pos[0]] = value
+            self._grid.set_cell(pos[0], pos[1], Cell.from_code(value.code))
         elif isinstance(value, tuple):
             if len(value) == 2:
-                self.cell_grid[pos[1]][pos[0]] = value[0]
-                self.place_grid[pos[1]][pos[0]] = value[1]
+                self._grid.set_cell(pos[0], pos[1], Cell.from_code(value[0].code))
+                self._grid.set_place(pos[0], pos[1], value[1])
             else:
                 raise ValueError(
                     f"Value has to be a tuple of length 2 being (Cell, bool), not {len(value)}"
@@ -296,6 +788,97 @@ class Level:
         else:
             raise ValueError(f"Invalid value type {type(value)}")
 
+        if self._saves or self._hash is not None:
+            index = pos[1] % self.height * self.width + pos[0] % self.width
+            for saved in self._saves.values():
+                if index < saved[2]:
+                    saved[2] = index
+
+            if self._hash is not None:
+                new_code = self._code(pos[0], pos[1])
+                self._hash ^= _cell_hash(index, old_code) ^ _cell_hash(index, new_code)
+
+    def _code(self, x: int, y: int) -> int:
+        return self._grid.get_cell(x, y).code + self._grid.get_place(x, y)
+
+    def _set_rect(self, x: int, y: int, width: int, height: int, codes: bytes) -> None:
+        # Write a rectangle of cell codes at once, the rectangle is inside
+        self._grid.set_rect(x, y, width, height, codes)
+        if width and height:
+            index = y * self.width + x
+            for saved in self._saves.values():
+                if index < saved[2]:
+                    saved[2] = index
+            self._hash = None
+
+    @property
+    def track_saves(self) -> bool:
+        """bool: If saving keeps what it encoded, so saving in the same format
+        again only encodes from the first cell that changed. What's kept takes
+        many times the memory of the cells, so it's off by default and turning
+        it off drops it. The last level code of every format is kept either
+        way, so saving an unchanged level never encodes it again."""
+        return self._track_saves
+
+    @track_saves.setter
+    def track_saves(self, value: bool) -> None:
+        self._track_saves = value
+        if not value:
+            self._saves.clear()
+
+    # Grids
+
+    @property
+    def backend(self) -> str:
+        """str: The name of the backend storing the cells of the level."""
+        return self._grid.name
+
+    @property
+    def nbytes(self) -> int:
+        """int: Roughly how many bytes the cells of the level take."""
+        return self._grid.nbytes
+
+    @property
+    def cell_grid(self) -> List[List[Cell]]:
+        """List[List[Cell]]: The cells of the level, row by row. Only the list
+        backend gives the lists it stores, the others give a copy."""
+        if self.backend == "list":
+            self._untrack()
+        return self._grid.cell_grid
+
+    @cell_grid.setter
+    def cell_grid(self, value: List[List[Cell]]) -> None:
+        self._untrack()
+        self._use_lists().cell_grid = value
+
+    @property
+    def place_grid(self) -> List[List[bool]]:
+        """List[List[bool]]: If the cells of the level are placeable, row by row.
+        Only the list backend gives the lists it stores, the others give a copy."""
+        if self.backend == "list":
+            self._untrack()
+        return self._grid.place_grid
+
+    @place_grid.setter
+    def place_grid(self, value: List[List[bool]]) -> None:
+        self._untrack()
+        self._use_lists().place_grid = value
+
+    def _untrack(self) -> None:
+        # The lists can be changed without the level knowing, so saves can't
+        # reuse anything until the cells are replaced with set_codes
+        self._saves.clear()
+        self._tracked = False
+        self._hash = None
+
+    def _use_lists(self) -> "ListGrid":
+        # Assigning the grids directly needs the lists to assign to
+        if not isinstance(self._grid, ListGrid):
+            self._grid = ListGrid.from_codes(
+                self.width, self.height, self._grid.to_codes()
+            )
+        return self._grid
+
     # Getting size
 
     @property
@@ -315,11 +898,36 @@ class Level:
 
     # Comparisons
 
+    def __hash__(self) -> int:
+        # Zobrist hashing, the cells hash to the hashes of every cell that isn't
+        # an empty bg xored together, so changing a cell only changes its part.
+        # Levels shouldn't be changed while they're in sets or dict keys
+        cells_hash = self._hash
+        if cells_hash is None:
+            occupied = self._grid.occupied()
+            cells_hash = functools.reduce(
+                operator.xor,
+                map(hash, zip(occupied, self._grid.get_codes(occupied))),
+                0,
+            )
+            if self._tracked:
+                self._hash = cells_hash
+
+        return hash(
+            (
+                self._size,
+                cells_hash,
+                self.tutorial_text,
+                self.name,
+                int(self.wall_effect),
+            )
+        )
+
     def __eq__(self, other: object) -> bool:
         if isinstance(other, Level):
             return (
-                self.cell_grid == other.cell_grid
-                and self.place_grid == other.place_grid
+                self.size == other.size
+                and self.to_codes() == other.to_codes()
                 and self.tutorial_text == other.tutorial_text
                 and self.name == other.name
                 and self.wall_effect == other.wall_effect
@@ -333,16 +941,244 @@ class Level:
                     f"The format {form[:10] + '...' if len(form) > 10 else form} is not supported or doesn't exist."
                 ) from ex
         if isinstance(other, list):
-            return self.cell_grid == other
+            # Row by row, so the lists of the level aren't given out
+            return len(other) == self.height and all(
+                self._grid.get_row(y)[0] == row for y, row in enumerate(other)
+            )
         raise TypeError(f"Cannot compare Level with {type(other)}")
 
 
-def open(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> Level:
+class LevelView:
+    """A rectangle of a level, get one by slicing the level like
+    level[2:5, 0:3]. Nothing is copied, changing the view changes the level,
+    and positions in the view start from its bottom left.
+
+    Args:
+        level (Level): The level.
+        x (int): The x of the left of the rectangle.
+        y (int): The y of the bottom of the rectangle.
+        width (int): The width of the rectangle.
+        height (int): The height of the rectangle.
+
+    Raises:
+        IndexError: If the rectangle isn't inside the level."""
+
+    def __init__(self, level: Level, x: int, y: int, width: int, height: int) -> None:
+        _check_rect(level, x, y, width, height)
+        self.level = level
+        self.x = x
+        self.y = y
+        self._size = (width, height)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Tuple[int, int]: The size of the view."""
+        return self._size
+
+    @property
+    def width(self) -> int:
+        """int: The width of the view."""
+        return self._size[0]
+
+    @property
+    def height(self) -> int:
+        """int: The height of the view."""
+        return self._size[1]
+
+    def __iter__(self) -> Iterator[Tuple[int, int, Cell, bool]]:
+        for x, y, cell, place in self.level.region(self.x, self.y, *self._size):
+            yield x - self.x, y - self.y, cell, place
+
+    def to_codes(self) -> bytes:
+        """Get the cell code of every cell in the view, see Level.from_codes.
+
+        Returns:
+            bytes: The cell codes, row by row."""
+        return self.level._grid.get_rect(self.x, self.y, *self._size)
+
+    def _pos(self, x: int, y: int) -> Tuple[int, int]:
+        # The position in the level, negative positions count from the end
+        if x < 0:
+            x += self.width
+        if y < 0:
+            y += self.height
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f"Position {x}, {y} is outside of the view.")
+        return self.x + x, self.y + y
+
+    def __getitem__(
+        self, pos: Union[Tuple[int, int, bool], Tuple[slice, slice]]
+    ) -> Union[Cell, bool, "LevelView"]:
+        if isinstance(pos[0], slice):
+            x, y, width, height = _slice_rect(pos, self.width, self.height)
+            return LevelView(self.level, self.x + x, self.y + y, width, height)
+        return self.level[(*self._pos(pos[0], pos[1]), pos[2])]
+
+    def __setitem__(
+        self,
+        pos: Union[Tuple[int, int], Tuple[slice, slice]],
+        value: Union[Cell, bool, Tuple[Cell, bool], Level, "LevelView"],
+    ) -> None:
+        if isinstance(pos[0], slice):
+            self[pos].set(value)
+        else:
+            self.level[self._pos(pos[0], pos[1])] = value
+
+    def fill(self, cell: Cell = None, place: bool = None) -> None:
+        """Set every cell in the view at once.
+
+        Args:
+            cell (Cell): The cell to fill the view with, the cells stay the
+                same if it's None.
+            place (bool): If the cells are placeable, they stay the same if
+                it's None."""
+        if cell is None and place is None:
+            return
+        area = self.width * self.height
+        if cell is not None and place is not None:
+            codes = bytes([cell.code + place]) * area
+        elif cell is not None:
+            codes = self.to_codes().translate(_FILL_TABLES[cell.code])
+        else:
+            codes = self.to_codes().translate(_PLACE_TABLES[place])
+        self.level._set_rect(self.x, self.y, *self._size, codes)
+
+    def blit(self, source: Union[Level, "LevelView"], x: int = 0, y: int = 0) -> None:
+        """Paste a level or a view into the view, every cell at once.
+
+        Args:
+            source (Union[Level, LevelView]): What to paste, it can be a view
+                of the same level, even one that overlaps this view.
+            x (int): The x in the view of the left of what's pasted.
+            y (int): The y in the view of the bottom of what's pasted.
+
+        Raises:
+            IndexError: If what's pasted doesn't fit in the view."""
+        width, height = source.size
+        if not (
+            0 <= x and 0 <= y and x + width <= self.width and y + height <= self.height
+        ):
+            raise IndexError(
+                f"A {width}x{height} level doesn't fit at {x}, {y} in the view."
+            )
+        self.level._set_rect(self.x + x, self.y + y, width, height, source.to_codes())
+
+    def set(
+        self, value: Union[Cell, bool, Tuple[Cell, bool], Level, "LevelView"]
+    ) -> None:
+        """Set the view from a value like setting a cell does, levels and views
+        are pasted and cells fill the view, see LevelView.fill.
+
+        Args:
+            value (Union[Cell, bool, Tuple[Cell, bool], Level, LevelView]):
+                The value.
+
+        Raises:
+            ValueError: If the value is invalid."""
+        if isinstance(value, (Level, LevelView)):
+            self.blit(value)
+        elif isinstance(value, bool):
+            self.fill(place=value)
+        elif isinstance(value, Cell):
+            self.fill(value)
+        elif isinstance(value, tuple) and len(value) == 2:
+            self.fill(*value)
+        else:
+            raise ValueError(f"Invalid value type {type(value)}")
+
+    def crop(self) -> Level:
+        """Copy the view into a new level with the same fields as the level.
+
+        Returns:
+            Level: The new level."""
+        return self.level.cropped(self.x, self.y, *self._size)
+
+
+def _check_rect(level: Level, x: int, y: int, width: int, height: int) -> None:
+    if not (
+        0 <= x
+        and 0 <= y
+        and 0 <= width
+        and 0 <= height
+        and x + width <= level.width
+        and y + height <= level.height
+    ):
+        raise IndexError(
+            f"The rectangle {x}, {y}, {width}x{height} isn't inside the level."
+        )
+
+
+def _slice_rect(
+    pos: Tuple[slice, slice], width: int, height: int
+) -> Tuple[int, int, int, int]:
+    # The rectangle of two slices, which work the same as slicing lists
+    if len(pos) != 2 or not isinstance(pos[1], slice):
+        raise TypeError("Levels are sliced with two slices, like level[2:5, 0:3].")
+    x_start, x_stop, x_step = pos[0].indices(width)
+    y_start, y_stop, y_step = pos[1].indices(height)
+    if x_step != 1 or y_step != 1:
+        raise ValueError("Levels can't be sliced with a step.")
+    return x_start, y_start, max(x_stop - x_start, 0), max(y_stop - y_start, 0)
+
+
+# Tables for bytes.translate that set the cell of every cell code, or if it's
+# placeable, and keep the other the same
+_FILL_TABLES = {
+    code: bytes(code + old % 2 if old < 74 else old for old in range(256))
+    for code in range(0, 74, 2)
+}
+_PLACE_TABLES = {
+    place: bytes(old - old % 2 + place if old < 74 else old for old in range(256))
+    for place in (False, True)
+}
+
+
+def _cell_hash(index: int, code: int) -> int:
+    # What a cell adds to the hash of a level, empty bgs add nothing
+    return 0 if code == 72 else hash((index, code))
+
+
+class DecodedLevel(NamedTuple):
+    """A level as cell codes, without making a Level, see Level.from_codes.
+    Formats decode level codes to this and encode this to level codes."""
+
+    width: int
+    height: int
+    codes: bytes
+    tutorial_text: str
+    name: str
+    wall_effect: int
+
+    @classmethod
+    def from_level(cls, level: Level) -> "DecodedLevel":
+        """Get the cell codes and fields of a level.
+
+        Args:
+            level (Level): The level.
+
+        Returns:
+            DecodedLevel: The cell codes and fields."""
+        return cls(
+            level.width,
+            level.height,
+            level.to_codes(),
+            level.tutorial_text,
+            level.name,
+            int(level.wall_effect),
+        )
+
+
+def open(
+    level_code: str, max_size: Tuple[int, int] = (0, 0), backend: str = None
+) -> Level:
     """Open a level from a level code.
 
     Args:
         level_code (str): The level code.
         max_size (Tuple[int, int]): The maximum size of the level.
+        backend (str): The backend to store the cells with, "list", "packed"
+            or "sparse". By default V1 uses sparse for big levels with few
+            cells, and everything else uses list.
 
     Returns:
         Level: The level.
@@ -350,23 +1186,223 @@ def open(level_code: str, max_size: Tuple[int, int] = (0, 0)) -> Level:
     Raises:
         LevelParseError: If the level code is invalid.
         LevelTooBigError: If the level is bigger than the given max size."""
-    for plugin in _plugins:
-        if level_code.startswith(plugin + ";"):
-            return importlib.import_module(f".{plugin}", "cell_machine_levels").open(
-                level_code,
-                max_size,
-            )
-    raise LevelParsingError(
-        f"The format {level_code.split(';')[0]} is not supported or doesn't exist."
+    format = level_code.partition(";")[0]
+    try:
+        open_level = formats.get_open(format)
+    except KeyError:
+        raise LevelParsingError(
+            f"The format {format} is not supported or doesn't exist."
+        ) from None
+    return open_level(level_code, max_size, backend)
+
+
+def transcode(
+    level_code: str, format: str, max_size: Tuple[int, int] = (0, 0), **options
+) -> str:
+    """Convert a level code to another format. The cells are converted as
+    cell codes, so no Level or Cells are made when both formats can decode
+    and encode, like V1, V2 and V3 can.
+
+    Args:
+        level_code (str): The level code.
+        format (str): The format to convert to.
+        max_size (Tuple[int, int]): The maximum size of the level.
+        **options: Options of the format to convert to, see Level.save.
+
+    Returns:
+        str: The level code in the new format.
+
+    Raises:
+        LevelParseError: If the level code is invalid.
+        LevelTooBigError: If the level is bigger than the given max size.
+        ValueError: If the format to convert to doesn't exist."""
+    from_format = level_code.partition(";")[0]
+    try:
+        decode = formats.get_decode(from_format)
+    except KeyError:
+        raise LevelParsingError(
+            f"The format {from_format} is not supported or doesn't exist."
+        ) from None
+    try:
+        encode = formats.get_encode(format)
+    except KeyError:
+        raise ValueError(
+            f"The format {format} is not supported or doesn't exist."
+        ) from None
+
+    if decode is None or encode is None:
+        return open(level_code, max_size).save(format, **options)
+    return encode(decode(level_code, max_size), **options)
+
+
+def open_many(
+    level_codes: Iterable[str],
+    max_size: Tuple[int, int] = (0, 0),
+    backend: str = None,
+    executor: Executor = None,
+    chunk_size: int = 64,
+) -> List[Union[Level, Exception]]:
+    """Open lots of levels, see open. A level code that can't be opened
+    doesn't stop the others from being opened.
+
+    Args:
+        level_codes (Iterable[str]): The level codes.
+        max_size (Tuple[int, int]): The maximum size of the levels.
+        backend (str): The backend to store the cells with.
+        executor (Executor): The thread or process pool to open the levels
+            in, they're opened one after another if it isn't given.
+        chunk_size (int): How many level codes to give the executor at once.
+
+    Returns:
+        List[Union[Level, Exception]]: The levels in the same order as the
+            level codes, or the LevelParsingError or LevelTooBigError of the
+            ones that couldn't be opened."""
+    function = functools.partial(_open_chunk, max_size=max_size, backend=backend)
+    return _run_chunks(function, level_codes, executor, chunk_size)
+
+
+def save_many(
+    levels: Iterable[Level],
+    format: str,
+    executor: Executor = None,
+    chunk_size: int = 64,
+) -> List[Union[str, Exception]]:
+    """Save lots of levels, see Level.save. A level that can't be saved
+    doesn't stop the others from being saved.
+
+    Args:
+        levels (Iterable[Level]): The levels.
+        format (str): The format to save the levels in.
+        executor (Executor): The thread or process pool to save the levels
+            in, they're saved one after another if it isn't given. Saving V3
+            is slow, so a process pool is the fastest.
+        chunk_size (int): How many levels to give the executor at once.
+
+    Returns:
+        List[Union[str, Exception]]: The level codes in the same order as the
+            levels, or the errors of the ones that couldn't be saved.
+
+    Raises:
+        ValueError: If the format doesn't exist."""
+    _check_format(format)
+    function = functools.partial(_save_chunk, format=format)
+    return _run_chunks(function, levels, executor, chunk_size)
+
+
+async def open_many_async(
+    level_codes: Iterable[str],
+    max_size: Tuple[int, int] = (0, 0),
+    backend: str = None,
+    executor: Executor = None,
+    chunk_size: int = 64,
+) -> List[Union[Level, Exception]]:
+    """Open lots of levels without blocking the event loop, see open_many.
+    The default executor of the event loop is used if none is given."""
+    function = functools.partial(_open_chunk, max_size=max_size, backend=backend)
+    return await _run_chunks_async(function, level_codes, executor, chunk_size)
+
+
+async def save_many_async(
+    levels: Iterable[Level],
+    format: str,
+    executor: Executor = None,
+    chunk_size: int = 64,
+) -> List[Union[str, Exception]]:
+    """Save lots of levels without blocking the event loop, see save_many.
+    The default executor of the event loop is used if none is given."""
+    _check_format(format)
+    function = functools.partial(_save_chunk, format=format)
+    return await _run_chunks_async(function, levels, executor, chunk_size)
+
+
+def _check_format(format: str) -> None:
+    try:
+        formats.get_save(format)
+    except KeyError:
+        raise ValueError(
+            f"The format {format} is not supported or doesn't exist."
+        ) from None
+
+
+def _open_chunk(
+    level_codes: List[str], max_size: Tuple[int, int], backend: str
+) -> list:
+    # Runs in the executor, so errors are returned instead of raised
+    results = []
+    for level_code in level_codes:
+        try:
+            results.append(open(level_code, max_size, backend))
+        except (LevelParsingError, LevelTooBigError) as e:
+            results.append(e)
+    return results
+
+
+def _save_chunk(levels: List[Level], format: str) -> list:
+    results = []
+    for level in levels:
+        try:
+            results.append(level.save(format))
+        except ValueError as e:
+            results.append(e)
+    return results
+
+
+def _chunks(items: Iterable, chunk_size: int) -> Iterator[list]:
+    if chunk_size < 1:
+        raise ValueError("The chunk size has to be at least 1.")
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _run_chunks(
+    function: Callable, items: Iterable, executor: Executor, chunk_size: int
+) -> list:
+    # Chunks make a task of many items, so there are fewer tasks to send
+    if executor is None:
+        chunk_results = map(function, _chunks(items, chunk_size))
+    else:
+        chunk_results = executor.map(function, _chunks(items, chunk_size))
+    return [result for results in chunk_results for result in results]
+
+
+async def _run_chunks_async(
+    function: Callable, items: Iterable, executor: Executor, chunk_size: int
+) -> list:
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    chunk_results = await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, function, chunk)
+            for chunk in _chunks(items, chunk_size)
+        )
     )
+    return [result for results in chunk_results for result in results]
 
 
 # Exceptions
 
 
 class LevelParsingError(Exception):
-    """Exception raised when parsing a level fails."""
+    """Exception raised when parsing a level fails.
+
+    Args:
+        message (str): What's wrong with the level code.
+        position (int): Where in the level code it's wrong, if it's known."""
+
+    def __init__(self, message: str = "", position: int = None) -> None:
+        super().__init__(message)
+        self.position = position
 
 
 class LevelTooBigError(Exception):
     """Exception raised when a level is bigger than the given max size."""
+
+
+from .grid import backends, ListGrid
@@ -0,0 +1,445 @@
+"""This module runs levels tick by tick, the way Cell Machine does.
+
+Every tick updates the generators, then the spinners and then the movers.
+Generators and movers are updated by the direction they face, right, left, up
+and then down, starting with the ones furthest in that direction. Every cell is
+updated at most once per tick, and cells are updated in the order they stood
+in when their turn in the tick started.
+
+The board is kept as one bytearray of cell codes without the placeable bit, so
+no Cell objects are made while simulating. Finding the cells to update is done
+with bytearray.find, so only the cells that do something cost Python code.
+
+BatchSimulation simulates many levels of the same size at once, stacked into
+one bytearray, so every find goes over all of them at once instead of costing
+Python code for every level.
+
+The cells are the whole state of a simulation, so once they repeat the
+simulation repeats forever. Simulation.run finds that from fingerprints of the
+cells, and skips the whole cycles left, so running a million ticks takes as
+long as the ticks before the cycle and one cycle."""
+
+import hashlib
+from collections import deque
+from typing import Callable, Iterable, List, NamedTuple, Optional
+from .level import CellEnum, Level, WallEffect
+
+_BG = 72
+
+# Direction of every rotation, in the order they're updated in
+_DIRECTIONS = (0, 2, 3, 1)
+
+# Cell codes to types and rotations
+_TYPES = [code // 2 % 9 if code < 72 else CellEnum.bg for code in range(74)]
+_ROTATIONS = [code // 18 if code < 72 else 0 for code in range(74)]
+
+# Cell codes rotated right by 0 to 3 steps
+_ROTATED = [
+    [
+        code % 18 + (code // 18 + amount) % 4 * 18 if code < 72 else code
+        for code in range(74)
+    ]
+    for amount in range(4)
+]
+
+# Tables for bytes.translate, splitting codes into the cell and placeable bit
+_CELL_TABLE = bytes(code - code % 2 for code in range(256))
+_PLACE_TABLE = bytes(code % 2 for code in range(256))
+
+
+class Cycle(NamedTuple):
+    """A cycle a simulation is in, see Simulation.run."""
+
+    # The first tick of the cycle, the cells after every tick from it repeat
+    # every period ticks
+    entry: int
+    period: int
+
+
+class Simulation:
+    """A simulation of a level, it has its own copy of the cells, so the level
+    only changes when the simulation is applied to it.
+
+    Args:
+        level (Level): The level to simulate."""
+
+    def __init__(self, level: Level) -> None:
+        self.width, self.height = level.size
+        self.wall_effect = WallEffect(level.wall_effect)
+        self.tick = 0
+
+        codes = level.to_codes()
+        self.cells = bytearray(codes.translate(_CELL_TABLE))
+        self._places = codes.translate(_PLACE_TABLE)
+        self._updated = bytearray(len(self.cells))
+
+    def to_codes(self) -> bytes:
+        """Get the cell code of every cell, see Level.from_codes.
+
+        Returns:
+            bytes: The cell codes, row by row."""
+        return bytes(cell + place for cell, place in zip(self.cells, self._places))
+
+    def apply(self, level: Level) -> None:
+        """Set the cells of a level to the cells of this simulation.
+
+        Args:
+            level (Level): The level, it has to be as big as the simulation."""
+        level.set_codes(self.to_codes())
+
+    def step(self, ticks: int = 1) -> None:
+        """Advance the simulation.
+
+        Args:
+            ticks (int): The amount of ticks to advance by."""
+        for _ in range(ticks):
+            self._tick()
+
+    def fingerprint(self) -> bytes:
+        """Get a fingerprint of the cells, simulations with the same cells
+        have the same fingerprint, and the same level keeps them the same.
+
+        Returns:
+            bytes: The fingerprint, a 16 byte hash."""
+        return hashlib.blake2b(self.cells, digest_size=16).digest()
+
+    def run(self, ticks: int, history: int = 1 << 16) -> Optional[Cycle]:
+        """Advance the simulation like step, but stop simulating once the
+        cells repeat and skip the rest of the ticks a cycle at a time.
+
+        Args:
+            ticks (int): The amount of ticks to advance by.
+            history (int): How many of the latest ticks are remembered, cycles
+                longer than this aren't found.
+
+        Returns:
+            Optional[Cycle]: The cycle that was found, None if the cells
+                didn't repeat before the last tick.
+
+        Raises:
+            ValueError: If the history isn't positive."""
+        if history < 1:
+            raise ValueError("The history has to be at least 1 tick.")
+        end = self.tick + ticks
+        # The tick of every fingerprint remembered, and the fingerprints of
+        # the latest ticks so the oldest can be forgotten. The deque only
+        # grows as ticks are simulated, so short runs stay cheap
+        seen = {}
+        recent = deque(maxlen=history)
+
+        while self.tick < end:
+            fingerprint = self.fingerprint()
+            entry = seen.get(fingerprint)
+            if entry is not None:
+                period = self.tick - entry
+                self.step((end - self.tick) % period)
+                self.tick = end
+                return Cycle(entry, period)
+
+            if len(recent) == history:
+                forgotten = recent[0]
+                if seen[forgotten] == self.tick - history:
+                    del seen[forgotten]
+            seen[fingerprint] = self.tick
+            recent.append(fingerprint)
+            self._tick()
+
+        return None
+
+    def _tick(self) -> None:
+        cells = self.cells
+        self._updated = updated = bytearray(len(cells))
+
+        for direction in _DIRECTIONS:
+            code = CellEnum.generator * 2 + direction * 18
+            for index in self._find(code, direction):
+                if cells[index] == code and not updated[index]:
+                    self._generate(index, direction)
+
+        for cell_type, amount in (
+            (CellEnum.spinner_right, 1),
+            (CellEnum.spinner_left, 3),
+        ):
+            for rotation in range(4):
+                for index in self._find(cell_type * 2 + rotation * 18, 0):
+                    self._spin(index, amount)
+
+        for direction in _DIRECTIONS:
+            code = CellEnum.mover * 2 + direction * 18
+            for index in self._find(code, direction):
+                if cells[index] == code and not updated[index]:
+                    updated[index] = 1
+                    self._push(index, direction, 0)
+
+        self.tick += 1
+
+    def _find(self, code: int, direction: int) -> list:
+        # Every cell with a code, the ones furthest in the direction first
+        found = []
+        index = self.cells.find(code)
+        while index != -1:
+            found.append(index)
+            index = self.cells.find(code, index + 1)
+
+        if direction in (0, 3):
+            found.reverse()
+        return found
+
+    def _wall_effect(self, index: int) -> WallEffect:
+        # The wall effect of the board a cell is on
+        return self.wall_effect
+
+    def _neighbour(self, index: int, direction: int) -> int:
+        # The next cell in a direction, -1 past a wall that doesn't wrap
+        width = self.width
+        wrap = self.wall_effect == WallEffect.wrap
+
+        if direction == 0:
+            if index % width != width - 1:
+                return index + 1
+            return index - width + 1 if wrap else -1
+        if direction == 2:
+            if index % width != 0:
+                return index - 1
+            return index + width - 1 if wrap else -1
+        if direction == 3:
+            if index + width < len(self.cells):
+                return index + width
+            return index % width if wrap else -1
+        if index >= width:
+            return index - width
+        return index - width + len(self.cells) if wrap else -1
+
+    def _push(self, index: int, direction: int, force: int) -> bool:
+        """Push the cell at index and everything in front of it one cell.
+
+        Args:
+            index (int): The first cell to push.
+            direction (int): The direction to push in.
+            force (int): The force pushing, movers in the row add to it if they
+                face the same way and take from it if they face the other way.
+
+        Returns:
+            bool: If the cells moved."""
+        cells = self.cells
+        updated = self._updated
+
+        row = []
+        current = index
+        while True:
+            code = cells[current]
+            if code == _BG:
+                break
+
+            cell_type = _TYPES[code]
+            if cell_type in (CellEnum.trash, CellEnum.enemy):
+                if not row:
+                    return False
+                break
+            if cell_type == CellEnum.immobile:
+                return False
+            if cell_type == CellEnum.slide and _ROTATIONS[code] % 2 != direction % 2:
+                return False
+            if cell_type == CellEnum.mover:
+                if _ROTATIONS[code] == direction:
+                    force += 1
+                elif _ROTATIONS[code] == (direction + 2) % 4:
+                    force -= 1
+
+            row.append(current)
+            current = self._neighbour(current, direction)
+            if current == index:
+                return False
+            if current == -1:
+                break
+
+        if force <= 0:
+            return False
+
+        if current == -1:
+            wall_effect = self._wall_effect(row[-1])
+            if wall_effect == WallEffect.flip:
+                cells[row[-1]] = _ROTATED[2][cells[row[-1]]]
+                return False
+            if wall_effect != WallEffect.delete:
+                return False
+        elif cells[current] == _BG:
+            cells[current] = cells[row[-1]]
+            updated[current] = updated[row[-1]]
+        elif _TYPES[cells[current]] == CellEnum.enemy:
+            cells[current] = _BG
+            updated[current] = 0
+
+        # The front cell is placed or destroyed, move the rest up behind it
+        for i in range(len(row) - 1, 0, -1):
+            cells[row[i]] = cells[row[i - 1]]
+            updated[row[i]] = updated[row[i - 1]]
+        cells[index] = _BG
+        updated[index] = 0
+        return True
+
+    def _generate(self, index: int, direction: int) -> None:
+        cells = self.cells
+        updated = self._updated
+        updated[index] = 1
+
+        behind = self._neighbour(index, (direction + 2) % 4)
+        front = self._neighbour(index, direction)
+        if behind == -1 or front == -1 or cells[behind] == _BG:
+            return
+
+        generated = cells[behind]
+        front_type = _TYPES[cells[front]]
+        if front_type == CellEnum.trash:
+            return
+        if front_type == CellEnum.enemy:
+            cells[front] = _BG
+            return
+        if cells[front] == _BG or self._push(front, direction, 1):
+            cells[front] = generated
+            updated[front] = 1
+
+    def _spin(self, index: int, amount: int) -> None:
+        cells = self.cells
+        for direction in range(4):
+            neighbour = self._neighbour(index, direction)
+            if neighbour != -1:
+                cells[neighbour] = _ROTATED[amount][cells[neighbour]]
+
+
+class BatchSimulation(Simulation):
+    """A simulation of many levels of the same size at once, like a Simulation
+    of each of them. The levels are stacked into one board, so the cost of
+    finding the cells to update is shared, and levels that are finished are
+    taken out so they don't cost anything.
+
+    Args:
+        levels (Iterable[Level]): The levels to simulate, every one can have
+            its own wall effect.
+
+    Raises:
+        ValueError: If the levels aren't all the same size."""
+
+    def __init__(self, levels: Iterable[Level]) -> None:
+        levels = list(levels)
+        self.width, self.height = levels[0].size if levels else (0, 0)
+        if any(level.size != (self.width, self.height) for level in levels):
+            raise ValueError("Every level has to be the same size.")
+        self.tick = 0
+        # The tick every level finished at, None until it finishes
+        self.finished: List[Optional[int]] = [None] * len(levels)
+
+        self._area = self.width * self.height
+        codes = [level.to_codes() for level in levels]
+        self.cells = bytearray(b"".join(codes).translate(_CELL_TABLE))
+        self._updated = bytearray(len(self.cells))
+        self._places = [level_codes.translate(_PLACE_TABLE) for level_codes in codes]
+        # The levels still simulated in the order they're stacked in, and
+        # their wall effects
+        self._levels = list(range(len(levels)))
+        self._wall_effects = bytes(int(level.wall_effect) for level in levels)
+        # The cells of the finished levels
+        self._finished_cells = {}
+
+    def __len__(self) -> int:
+        return len(self.finished)
+
+    def to_codes(self, level: int = 0) -> bytes:
+        """Get the cell code of every cell of a level, see Level.from_codes.
+
+        Args:
+            level (int): The number of the level, in the order they were
+                given.
+
+        Returns:
+            bytes: The cell codes, row by row."""
+        cells = self._finished_cells.get(level)
+        if cells is None:
+            start = self._levels.index(level) * self._area
+            cells = self.cells[start : start + self._area]
+        return bytes(cell + place for cell, place in zip(cells, self._places[level]))
+
+    def apply(self, level: Level, number: int = 0) -> None:
+        """Set the cells of a level to the cells of a level of this simulation.
+
+        Args:
+            level (Level): The level, it has to be as big as the simulation.
+            number (int): The number of the level of this simulation."""
+        level.set_codes(self.to_codes(number))
+
+    def step(self, ticks: int = 1, done: Callable[[bytes], bool] = None) -> None:
+        """Advance the levels that aren't finished. A level is finished once
+        a tick doesn't change it, since it never changes again, or once done
+        says it is.
+
+        Args:
+            ticks (int): The amount of ticks to advance by.
+            done (Callable[[bytes], bool]): Gets the cells of a level after
+                every tick, without the placeable bit, and says if it's
+                finished."""
+        area = self._area
+        for tick in range(ticks):
+            if not self._levels:
+                self.tick += ticks - tick
+                return
+            if not area:
+                # Levels without cells never change, they finish on the first
+                self.tick += 1
+                self._finish(list(range(len(self._levels))))
+                continue
+
+            before = bytes(self.cells)
+            self._tick()
+            cells, before = memoryview(self.cells), memoryview(before)
+            finished = [
+                stacked
+                for stacked, start in enumerate(range(0, len(cells), area))
+                if cells[start : start + area] == before[start : start + area]
+                or (done is not None and done(bytes(cells[start : start + area])))
+            ]
+            cells.release()
+            if finished:
+                self._finish(finished)
+
+    def _finish(self, finished: List[int]) -> None:
+        # Take finished levels out of the stack
+        area = self._area
+        for stacked in finished:
+            level = self._levels[stacked]
+            self.finished[level] = self.tick
+            self._finished_cells[level] = bytes(
+                self.cells[stacked * area : (stacked + 1) * area]
+            )
+
+        kept = sorted(set(range(len(self._levels))).difference(finished))
+        self.cells = bytearray().join(
+            self.cells[stacked * area : (stacked + 1) * area] for stacked in kept
+        )
+        self._updated = bytearray(len(self.cells))
+        self._levels = [self._levels[stacked] for stacked in kept]
+        self._wall_effects = bytes(self._wall_effects[stacked] for stacked in kept)
+
+    def _wall_effect(self, index: int) -> WallEffect:
+        return self._wall_effects[index // self._area]
+
+    def _neighbour(self, index: int, direction: int) -> int:
+        # Like Simulation._neighbour, without leaving the level of the cell
+        width, area = self.width, self._area
+        start = index - index % area
+        wrap = self._wall_effects[start // area] == WallEffect.wrap
+
+        if direction == 0:
+            if index % width != width - 1:
+                return index + 1
+            return index - width + 1 if wrap else -1
+        if direction == 2:
+            if index % width != 0:
+                return index - 1
+            return index + width - 1 if wrap else -1
+        if direction == 3:
+            if index + width < start + area:
+                return index + width
+            return index + width - area if wrap else -1
+        if index - width >= start:
+            return index - width
+        return index - width + area if wrap else -1
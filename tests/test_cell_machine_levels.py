@@ -1,4 +1,7 @@
-import cell_machine_levels, unittest
+import cell_machine_levels, cell_machine_levels.__main__, unittest
+import cell_machine_levels.simulate
+import unittest.mock
+import asyncio, concurrent.futures, contextlib, io, os, pickle, random, tempfile, types
 
 
 class TestLevel(unittest.TestCase):
@@ -38,6 +41,823 @@ class TestLevel(unittest.TestCase):
         self.assertNotEqual(test.save("V3"), "V3;a;a;}{(0)8Y;;test;2")
         self.assertNotEqual(test.save("V3"), "V3;a;a;}{(0(8)Y;;test;2")
 
+    def test_save_v3_back_references(self):
+        test = cell_machine_levels.level.Level(20, 20, "", "test", 0)
+        for x in range(20):
+            for y in range(0, 20, 3):
+                test[x, y] = cell_machine_levels.level.Cell((x * y) % 9, (x + y) % 4)
+            test[x, 19] = x % 2 == 0
+
+        code = test.save("V3")
+        self.assertLess(len(code), 400)
+        self.assertEqual(test, cell_machine_levels.level.open(code))
+
+        # Far matches on a board of 2 cells, the encoder that tried every
+        # offset made 2754 characters
+        rng = random.Random(0)
+        codes = bytes(rng.choice((6, 73)) for _ in range(80 * 80))
+        test = cell_machine_levels.level.Level.from_codes(
+            80, 80, codes, "", "baseline", 0
+        )
+        code = test.save("V3")
+        self.assertLessEqual(len(code), 2754)
+        self.assertEqual(test, cell_machine_levels.level.open(code))
+
+    def test_open_non_square(self):
+        test = cell_machine_levels.level.Level(7, 3, "", "test", 0)
+        test[0, 1] = True
+        test[6, 2] = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.generator,
+            cell_machine_levels.level.Rotation.left,
+        )
+
+        self.assertEqual(test, cell_machine_levels.level.open(test.save("V2")))
+        self.assertEqual(test, cell_machine_levels.level.open(test.save("V3")))
+        self.assertEqual(
+            test, cell_machine_levels.level.open("V3;7;3;{)06})77)05A;;test;0")
+        )
+        self.assertRaises(
+            cell_machine_levels.level.LevelParsingError,
+            cell_machine_levels.level.open,
+            "V3;7;3;{)0z;;test;0",
+        )
+
+    def test_packed_backend(self):
+        test = cell_machine_levels.level.Level(10, 10, "", "test", 2, "packed")
+        test[0, 0] = True
+        test[0, 1] = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.mover,
+            cell_machine_levels.level.Rotation.up,
+        )
+        self.assertEqual(test.backend, "packed")
+        self.assertEqual(test.save("V1"), "V1;10;10;0.0;3.3.0.1;test;2")
+        self.assertEqual(test.save("V3"), "V3;a;a;}{)08Y;;test;2")
+        self.assertEqual(
+            test,
+            cell_machine_levels.level.open("V3;a;a;}{)08Y;;test;2", backend="list"),
+        )
+
+        clone = test.clone()
+        clone[0, 1] = cell_machine_levels.level.Cell()
+        self.assertEqual(test[0, 1, False], cell_machine_levels.level.CellEnum.mover)
+        self.assertTrue(test[0, 0, True])
+
+        resized = test.resized(1, 0, 0, 2)
+        self.assertEqual(resized.size, (11, 12))
+        self.assertEqual(resized[1, 3, False], (3, 3))
+        self.assertEqual(
+            resized, cell_machine_levels.level.open(resized.save("V2"), backend="list")
+        )
+
+    def test_cell_flyweight(self):
+        cell = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.mover,
+            cell_machine_levels.level.Rotation.up,
+        )
+        self.assertIs(cell, cell_machine_levels.level.Cell(3, 3))
+        self.assertIs(cell.rotate_right(), cell_machine_levels.level.Cell(3, 0))
+        self.assertIs(
+            cell_machine_levels.level.Cell(9, 2).rotate_left(),
+            cell_machine_levels.level.Cell(),
+        )
+        with self.assertRaises(AttributeError):
+            cell.rotation = 1
+
+        mutable = cell_machine_levels.level.MutableCell(3, 3)
+        mutable.rotate_right()
+        self.assertEqual(mutable, cell.rotate_right())
+        self.assertEqual(mutable.rotation, 0)
+
+        test = cell_machine_levels.level.Level(2, 2)
+        test[1, 1] = mutable
+        mutable.rotate_right()
+        self.assertIs(test[1, 1, False], cell_machine_levels.level.Cell(3, 0))
+        self.assertIs(test.clone()[1, 1, False], test[1, 1, False])
+
+    def test_clone_copy_on_write(self):
+        for backend in ("list", "packed"):
+            test = cell_machine_levels.level.Level(4, 4, "", "test", 0, backend)
+            test[1, 1] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.push,
+                cell_machine_levels.level.Rotation.down,
+            )
+            clone = test.clone()
+            clone[2, 1] = True
+            test[0, 1] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.enemy
+            )
+
+            self.assertFalse(test[2, 1, True])
+            self.assertEqual(clone[0, 1, False], cell_machine_levels.level.CellEnum.bg)
+            self.assertEqual(clone[1, 1, False], (5, 1))
+
+            optimized = test.optimized()
+            self.assertEqual(optimized[1, 1, False], (5, 0))
+            self.assertEqual(test[1, 1, False], (5, 1))
+
+        # Comparing with lists doesn't give out the rows
+        test = cell_machine_levels.level.Level(4, 4, "", "test", 0)
+        cell_grid = test.clone().cell_grid
+        self.assertEqual(test, cell_grid)
+        cell_grid[3][1] = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.mover
+        )
+        self.assertNotEqual(test, cell_grid)
+        self.assertNotEqual(test, cell_grid[:3])
+        self.assertFalse(test._grid._given_out)
+        self.assertIs(test.clone()._grid._cell_rows[0], test._grid._cell_rows[0])
+
+        # The rows that were given out can change after cloning
+        cell_grid = test.cell_grid
+        place_grid = test.place_grid
+        clone = test.clone()
+        cell_grid[0][0] = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.mover
+        )
+        place_grid[0][0] = True
+        self.assertEqual(test[0, 0, False], cell_machine_levels.level.CellEnum.mover)
+        self.assertEqual(clone[0, 0, False], cell_machine_levels.level.CellEnum.bg)
+        self.assertFalse(clone[0, 0, True])
+
+    def test_step(self):
+        for backend in ("list", "packed"):
+            test = cell_machine_levels.level.Level(6, 3, "", "test", 0, backend)
+            test[0, 0] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.mover
+            )
+            test[1, 0] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.push
+            )
+            test[1, 0] = True
+            test[0, 2] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.push
+            )
+            test[1, 2] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.generator
+            )
+            test[4, 2] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.trash
+            )
+
+            test.step(2)
+            self.assertEqual(test.backend, backend)
+            self.assertEqual(test[2, 0, False], (3, 0))
+            self.assertEqual(test[3, 0, False], (5, 0))
+            self.assertTrue(test[1, 0, True])
+            self.assertEqual(test[2, 2, False], (5, 0))
+            self.assertEqual(test[3, 2, False], (5, 0))
+
+            # The generated cells are pushed into the trash from now on
+            test.step(3)
+            self.assertEqual(test[3, 2, False], (5, 0))
+            self.assertEqual(test[4, 2, False], (8, 0))
+            self.assertEqual(test[5, 2, False], cell_machine_levels.level.CellEnum.bg)
+
+    def test_step_wall_effects(self):
+        ends = {
+            cell_machine_levels.level.WallEffect.stop: ((2, 3), (3, 5)),
+            cell_machine_levels.level.WallEffect.wrap: ((0, 5), (3, 3)),
+            cell_machine_levels.level.WallEffect.delete: ((3, 3),),
+            cell_machine_levels.level.WallEffect.flip: ((2, 3), (3, 5)),
+        }
+        for wall_effect, cells in ends.items():
+            test = cell_machine_levels.level.Level(4, 1, "", "test", wall_effect)
+            test[2, 0] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.mover
+            )
+            test[3, 0] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.push
+            )
+            test.step()
+
+            self.assertEqual(
+                [(x, cell.type) for x, _, cell, _ in test if cell.type != 9],
+                list(cells),
+            )
+
+        # Flipping turns the mover around when it's against the wall
+        test = cell_machine_levels.level.Level(2, 1, "", "test", 3)
+        test[1, 0] = cell_machine_levels.level.Cell(
+            cell_machine_levels.level.CellEnum.mover
+        )
+        test.step(2)
+        self.assertEqual(test[0, 0, False], (3, 2))
+
+    def test_run_cycles(self):
+        # A mover pushing a cell around a wrapping level repeats every 5 ticks
+        test = cell_machine_levels.level.open("V1;5;1;;3.0.1.0,5.0.2.0;test;1")
+        simulation = cell_machine_levels.simulate.Simulation(test)
+        self.assertEqual(simulation.run(10**9 + 2), (0, 5))
+        self.assertEqual(simulation.tick, 10**9 + 2)
+        expected = test.clone()
+        expected.step(2)
+        self.assertEqual(simulation.to_codes(), expected.to_codes())
+        self.assertIsNone(cell_machine_levels.simulate.Simulation(test).run(4))
+
+        # Against a wall that stops it, it stays still after 2 ticks
+        test.wall_effect = cell_machine_levels.level.WallEffect.stop
+        simulation = cell_machine_levels.simulate.Simulation(test)
+        self.assertEqual(simulation.run(10**9, history=1), (2, 1))
+        test.step(10**9)
+        self.assertEqual(test[4, 0, False], (5, 0))
+        self.assertEqual(test[3, 0, False], (3, 0))
+
+    def test_batch_simulation(self):
+        # The same mover with every wall effect, and one pushing an enemy
+        levels = [
+            cell_machine_levels.level.open(f"V1;4;1;;3.0.2.0;test;{wall_effect}")
+            for wall_effect in range(4)
+        ]
+        levels.append(cell_machine_levels.level.open("V1;4;1;;3.0.0.0,7.0.3.0;;0"))
+        batch = cell_machine_levels.simulate.BatchSimulation(levels)
+        batch.step(5, done=lambda cells: not cells.strip(b"H"))
+
+        for number, level in enumerate(levels):
+            simulation = cell_machine_levels.simulate.Simulation(level)
+            simulation.step(5)
+            self.assertEqual(batch.to_codes(number), simulation.to_codes())
+        # Stopped against the wall, deleted, and killed by the enemy
+        self.assertEqual(batch.finished, [2, None, 2, None, 3])
+        self.assertEqual(batch.tick, 5)
+
+        batch.apply(levels[1], 1)
+        self.assertEqual(levels[1][3, 0, False], (3, 0))
+        self.assertRaises(
+            ValueError,
+            cell_machine_levels.simulate.BatchSimulation,
+            [levels[0], cell_machine_levels.level.Level(2, 2)],
+        )
+
+        # Levels without cells finish on the first tick
+        batch = cell_machine_levels.simulate.BatchSimulation(
+            [cell_machine_levels.level.Level(0, 3)] * 2
+        )
+        batch.step(4)
+        self.assertEqual(batch.finished, [1, 1])
+        self.assertEqual(batch.tick, 4)
+        self.assertEqual(batch.to_codes(1), b"")
+
+    def test_convert_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "levels.txt")
+            with open(path, "w") as file:
+                file.write("V1;10;10;0.0;3.3.0.1;test;2\nV9;a;a;;;test;2\n")
+                file.write("\nV2;a;a;}{)8Y;;test;2\n")
+
+            for jobs in ("1", "2"):
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(
+                    io.StringIO()
+                ):
+                    exit_code = cell_machine_levels.__main__.main(
+                        ["convert", "--to", "V3", "--jobs", jobs, path]
+                    )
+
+                self.assertEqual(exit_code, 1)
+                self.assertEqual(
+                    stdout.getvalue().splitlines(),
+                    ["V3;a;a;}{)08Y;;test;2", "", "", "V3;a;a;}{)08Y;;test;2"],
+                )
+
+            for jobs in ("-1", "x"):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    self.assertRaises(
+                        SystemExit,
+                        cell_machine_levels.__main__.main,
+                        ["convert", "--to", "V3", "--jobs", jobs, path],
+                    )
+
+    def test_formats(self):
+        self.assertIn("V3", cell_machine_levels.formats.names())
+        self.assertIs(
+            cell_machine_levels.formats.get_save("V2"),
+            cell_machine_levels.V2.save,
+        )
+
+        # The registry is put back after the test, without the Test format
+        formats = cell_machine_levels.formats
+        for registry in (
+            formats._loaders,
+            formats._opens,
+            formats._saves,
+            formats._decodes,
+            formats._encodes,
+            formats._reencodes,
+        ):
+            patcher = unittest.mock.patch.dict(registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        cell_machine_levels.formats.register(
+            "Test",
+            types.SimpleNamespace(
+                open=lambda level_code, max_size, backend: (
+                    cell_machine_levels.level.Level(1, 1, "", level_code[5:])
+                ),
+                save=lambda level: f"Test;{level.name}",
+            ),
+        )
+        test = cell_machine_levels.level.open("Test;test")
+        self.assertEqual(test.name, "test")
+        self.assertEqual(test.save("Test"), "Test;test")
+
+        self.assertRaises(
+            cell_machine_levels.level.LevelParsingError,
+            cell_machine_levels.level.open,
+            "V0;a;a;;;test;0",
+        )
+        self.assertRaises(ValueError, test.save, "V0")
+
+    def test_open_errors(self):
+        test = cell_machine_levels.level.Level(12, 3, "", "test", 0)
+        test[11, 2] = True
+        self.assertEqual(test, cell_machine_levels.level.open("V1;12;3;11.2;;test;0"))
+        self.assertEqual(
+            cell_machine_levels.level.open("V1;12;3;;;test;0"),
+            cell_machine_levels.level.Level(12, 3, "", "test", 0),
+        )
+
+        for level_code, position in (
+            ("V1;12;3;11.2,;;test;0", 12),
+            ("V1;12;3;;0.0.12.0;test;0", 9),
+            ("V2;a;a;{)3(;;test;0", 10),
+            ("V2;a;a;{(3z;;test;0", 8),
+            ("V3;a;a;{{)5z;;test;0", 9),
+            ("V3;a;a;{,{;;test;0", 8),
+            ("V3;a;a;{{;;test test;0", 10),
+        ):
+            with self.assertRaises(
+                cell_machine_levels.level.LevelParsingError
+            ) as context:
+                cell_machine_levels.level.open(level_code)
+            self.assertEqual(context.exception.position, position, level_code)
+
+    def test_base74(self):
+        for number in (0, 9, 10, 73, 74, 5475, 5476, 74**5 + 3):
+            self.assertEqual(
+                cell_machine_levels.base74.b74_decode(
+                    cell_machine_levels.base74.b74_encode(number)
+                ),
+                number,
+            )
+        self.assertEqual(cell_machine_levels.base74.b74_encode(74), "10")
+
+        digits = bytes(range(74))
+        self.assertEqual(
+            cell_machine_levels.base74.b74_encode_digits(digits),
+            cell_machine_levels.base74.b74_key,
+        )
+        self.assertEqual(
+            cell_machine_levels.base74.b74_decode_digits(
+                cell_machine_levels.base74.b74_key
+            ),
+            digits,
+        )
+        self.assertRaises(
+            ValueError, cell_machine_levels.base74.b74_decode_digits, "{(}"
+        )
+        self.assertRaises(
+            ValueError, cell_machine_levels.base74.b74_encode_digits, b"\x4a"
+        )
+
+    def test_level_cache(self):
+        cache = cell_machine_levels.cache.LevelCache(max_entries=2)
+        test = cache.open("V3;a;a;}{)08Y;;test;2")
+        test[0, 1] = cell_machine_levels.level.Cell()
+        self.assertEqual(
+            cache.open("V3;a;a;}{)08Y;;test;2")[0, 1, False],
+            cell_machine_levels.level.CellEnum.mover,
+        )
+        self.assertRaises(
+            cell_machine_levels.level.LevelTooBigError,
+            cache.open,
+            "V3;a;a;}{)08Y;;test;2",
+            (5, 5),
+        )
+
+        cache.open("V3;a;a;;;test;2")
+        cache.open("V3;a;a;;;test;2", backend="packed")
+        self.assertEqual(cache.info()[:4], (2, 3, 1, 2))
+
+        cache = cell_machine_levels.cache.LevelCache(0, 500)
+        for size in "abc":
+            cache.open(f"V3;{size};{size};;;test;0", backend="packed")
+        self.assertLessEqual(cache.info().nbytes, 500)
+        self.assertLess(len(cache), 3)
+
+    def test_iteration(self):
+        for backend in ("list", "packed"):
+            test = cell_machine_levels.level.Level(4, 3, "", "test", 0, backend)
+            test[1, 2] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.slide
+            )
+            test[3, 0] = True
+
+            # Nested iteration doesn't share the position
+            pairs = [(a[:2], b[:2]) for a in test for b in test]
+            self.assertEqual(len(pairs), 144)
+            self.assertEqual(pairs[14], ((1, 0), (2, 0)))
+
+            self.assertEqual(
+                [(y, len(cells), places[3]) for y, cells, places in test.rows()],
+                [(0, 4, True), (1, 4, False), (2, 4, False)],
+            )
+            self.assertEqual(
+                [cell[:2] for cell in test.region(1, 1, 2, 2)],
+                [(1, 1), (2, 1), (1, 2), (2, 2)],
+            )
+            self.assertRaises(IndexError, list, test.region(3, 0, 2, 1))
+
+            self.assertEqual([cell[:2] for cell in test.occupied()], [(3, 0), (1, 2)])
+            test[3, 0] = False
+            test[0, 1] = cell_machine_levels.level.Cell(
+                cell_machine_levels.level.CellEnum.trash
+            )
+            clone = test.clone()
+            clone[1, 2] = cell_machine_levels.level.Cell()
+            self.assertEqual([cell[:2] for cell in test.occupied()], [(0, 1), (1, 2)])
+            self.assertEqual([cell[:2] for cell in clone.occupied()], [(0, 1)])
+
+    def test_sparse_backend(self):
+        test = cell_machine_levels.level.open(
+            "V1;10000;10000;9999.9999;3.3.5.7,6.0.9000.20;big;0"
+        )
+        self.assertEqual(test.backend, "sparse")
+        self.assertEqual(test[5, 7, False], (3, 3))
+        self.assertTrue(test[9999, 9999, True])
+        self.assertEqual(
+            test.save("V1"), "V1;10000;10000;9999.9999;3.3.5.7,6.0.9000.20;big;0"
+        )
+
+        clone = test.clone()
+        clone[5, 7] = cell_machine_levels.level.Cell()
+        self.assertEqual(len(list(clone.occupied())), 2)
+        self.assertEqual(len(list(test.occupied())), 3)
+
+        small = cell_machine_levels.level.open("V3;a;a;}{)08Y;;test;2")
+        self.assertEqual(small.backend, "list")
+        sparse = cell_machine_levels.level.open(
+            "V3;a;a;}{)08Y;;test;2", backend="sparse"
+        )
+        self.assertEqual(sparse, small)
+        self.assertEqual(sparse.resized(1, 2, 3, 4), small.resized(1, 2, 3, 4))
+        self.assertEqual(sparse.save("V2"), small.save("V2"))
+
+    def test_transcode(self):
+        level_code = "V3;a;a;}{)08Y;;test;2"
+        test = cell_machine_levels.level.open(level_code)
+        for format in ("V1", "V2", "V3"):
+            self.assertEqual(
+                cell_machine_levels.level.transcode(level_code, format),
+                test.save(format),
+            )
+            self.assertEqual(
+                cell_machine_levels.level.transcode(test.save("V1"), format),
+                test.save(format),
+            )
+
+        self.assertRaises(
+            cell_machine_levels.level.LevelTooBigError,
+            cell_machine_levels.level.transcode,
+            level_code,
+            "V2",
+            (5, 5),
+        )
+        self.assertRaises(
+            cell_machine_levels.level.LevelParsingError,
+            cell_machine_levels.level.transcode,
+            "V0;a;a;;;test;0",
+            "V3",
+        )
+        self.assertRaises(
+            ValueError, cell_machine_levels.level.transcode, level_code, "V0"
+        )
+
+    def test_incremental_save(self):
+        test = cell_machine_levels.level.open("V3;a;a;}{)08Y;;test;2")
+        test.track_saves = True
+        test.save("V2")
+        test.save("V3")
+        for x, y, value in (
+            (9, 9, cell_machine_levels.level.Cell(3, 1)),
+            (5, 5, True),
+            (9, 9, cell_machine_levels.level.Cell()),
+            (-1, 0, (cell_machine_levels.level.Cell(4, 2), True)),
+            (0, 0, cell_machine_levels.level.Cell(1, 3)),
+        ):
+            test[x, y] = value
+            self.assertEqual(test.save("V2"), cell_machine_levels.V2.save(test))
+            self.assertEqual(test.save("V3"), cell_machine_levels.V3.save(test))
+
+        # Lists that are given out can change without the level knowing
+        cell_grid = test.cell_grid
+        test.save("V3")
+        cell_grid[2][2] = cell_machine_levels.level.Cell(6, 0)
+        self.assertEqual(test.save("V3"), cell_machine_levels.V3.save(test))
+
+        # V1 and the hash only go over the occupied cells, which can't be kept
+        test.save("V1")
+        hash(test)
+        cell_grid[3][2] = cell_machine_levels.level.Cell(3, 0)
+        self.assertIn("3.0.2.3", test.save("V1"))
+        self.assertIn((2, 3), [(x, y) for x, y, _, _ in test.occupied()])
+        other = cell_machine_levels.level.open(test.save("V3"))
+        self.assertEqual(test, other)
+        self.assertEqual(hash(test), hash(other))
+
+        # Only the level code is kept without tracking, clones track like the level
+        clone = test.clone()
+        self.assertTrue(clone.track_saves)
+        test.track_saves = False
+        self.assertEqual(test._saves, {})
+        test = cell_machine_levels.level.open("V3;a;a;}{)08Y;;test;2")
+        self.assertFalse(test.track_saves)
+        level_code = test.save("V3")
+        self.assertEqual(test._saves["V3"][:2], [None, None])
+
+        # Comparing with a level code doesn't encode again until a change
+        with cell_machine_levels.instrument.Profile() as profile:
+            for _ in range(3):
+                self.assertEqual(test, level_code)
+            test[4, 4] = cell_machine_levels.level.Cell(2, 1)
+            self.assertNotEqual(test, level_code)
+            test.name = "renamed"
+            level_code = test.save("V3")
+        self.assertEqual(profile.counts["saves reused"], 3)
+        self.assertEqual(profile.calls["V3 encode matches"], 2)
+        self.assertEqual(level_code, cell_machine_levels.V3.save(test))
+
+    def test_corpus(self):
+        level_codes = [
+            "V3;a;a;}{)08Y;;test;2",
+            "V1;3;2;0.0;1.2.2.1;one;0",
+            "V2;5;5;;;two;1",
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.txt")
+            index = os.path.join(directory, "corpus.idx")
+            with cell_machine_levels.corpus.CorpusWriter(path, "V3", index) as writer:
+                offsets = [writer.write(level_codes[0])]
+                offsets += [
+                    writer.write(cell_machine_levels.level.open(level_code))
+                    for level_code in level_codes[1:]
+                ]
+                # The reader would skip these, so the index wouldn't fit
+                for level_code in ("", "V1;1;1;;;a\n;0"):
+                    self.assertRaises(ValueError, writer.write, level_code)
+
+            with cell_machine_levels.corpus.CorpusReader(path, index) as reader:
+                self.assertEqual(len(reader), 3)
+                self.assertEqual([offset for offset, _ in reader.codes()], offsets)
+                self.assertEqual(
+                    [test.name for _, test in reader.levels()],
+                    ["test", "one", "two"],
+                )
+                self.assertEqual(reader.open(1), level_codes[1])
+                self.assertEqual(reader[-1], "V3;5;5;;;two;1")
+
+                record = reader.record(1)
+                self.assertEqual(record.offset, offsets[1])
+                self.assertEqual(record[2:], ("V3", 3, 2, "one", 0))
+                self.assertEqual(
+                    [record.width for record in reader.records()], [10, 3, 5]
+                )
+
+            # Empty lines are skipped, and the old index doesn't fit anymore
+            with open(path, "a") as file:
+                file.write("\r\n\nV1;1;1;;;three;3\n")
+            self.assertRaises(
+                ValueError, cell_machine_levels.corpus.CorpusReader, path, index
+            )
+            with cell_machine_levels.corpus.CorpusReader(path) as reader:
+                self.assertEqual(len(reader), 4)
+                self.assertEqual(reader.record(3).name, "three")
+
+    def test_open_and_save_many(self):
+        level_codes = ["V3;a;a;}{)08Y;;test;2", "V9;a;a;;;test;2", "V1;3;3;;;x;0"] * 3
+
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            levels = cell_machine_levels.level.open_many(
+                level_codes, executor=executor, chunk_size=2
+            )
+        self.assertEqual(len(levels), 9)
+        self.assertIsInstance(levels[4], cell_machine_levels.level.LevelParsingError)
+        self.assertEqual(levels[6], level_codes[0])
+        self.assertEqual(levels[8].name, "x")
+
+        levels = [levels[0], levels[2]] * 2
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            self.assertEqual(
+                cell_machine_levels.level.save_many(levels, "V3", executor, 1),
+                ["V3;a;a;}{)08Y;;test;2", "V3;3;3;;;x;0"] * 2,
+            )
+        self.assertRaises(ValueError, cell_machine_levels.level.save_many, levels, "V0")
+
+        self.assertEqual(
+            asyncio.run(cell_machine_levels.level.save_many_async(levels, "V1")),
+            cell_machine_levels.level.save_many(levels, "V1"),
+        )
+        self.assertIsInstance(
+            asyncio.run(cell_machine_levels.level.open_many_async(level_codes))[1],
+            cell_machine_levels.level.LevelParsingError,
+        )
+
+        # Levels are pickled as cell codes to send them to other processes
+        for backend in ("list", "packed", "sparse"):
+            test = cell_machine_levels.level.open(level_codes[0], backend=backend)
+            copied = pickle.loads(pickle.dumps(test))
+            self.assertEqual(copied, test)
+            self.assertEqual(copied.backend, backend)
+
+    def test_hash(self):
+        test = cell_machine_levels.level.open("V3;a;a;}{)08Y;;test;2")
+        same = cell_machine_levels.level.open(test.save("V1"), backend="sparse")
+        self.assertEqual(hash(test), hash(same))
+        self.assertEqual(len({test, same, test.clone()}), 1)
+
+        # Changing cells updates the hash instead of hashing everything again
+        test[4, 4] = cell_machine_levels.level.Cell(3, 1)
+        self.assertNotEqual(hash(test), hash(same))
+        test[4, 4] = cell_machine_levels.level.Cell()
+        self.assertEqual(hash(test), hash(same))
+
+        same.name = "other"
+        self.assertNotEqual(hash(test), hash(same))
+
+    def test_dedup(self):
+        # A mover to the right of a clockwise spinner, and its mirror image
+        index = cell_machine_levels.dedup.DedupIndex()
+        self.assertIsNone(index.add("V1;3;2;;1.0.0.0,3.0.1.0;one;0", 1))
+        self.assertEqual(index.add("V3;3;2;;;two;0", 2), None)
+        self.assertEqual(index.add("V1;3;2;;2.0.2.0,3.2.1.0;three;0", 3), 1)
+        self.assertEqual(index.add("V2;2;3;{{o{2;;four;0", 4), 1)
+        self.assertEqual(index.find("V3;3;2;;;five;0"), [2])
+        self.assertNotIn("V3;3;2;;;six;1", index)
+        self.assertEqual(index.duplicates(), [[1, 3, 4]])
+        self.assertEqual(len(index), 2)
+
+        exact = cell_machine_levels.dedup.DedupIndex(symmetries=False)
+        exact.add("V1;3;2;;1.0.0.0,3.0.1.0;one;0", 1)
+        self.assertNotIn("V1;3;2;;2.0.2.0,3.2.1.0;three;0", exact)
+
+    def test_save_v3_effort(self):
+        # Random levels that repeat a row of random length, with some changes
+        rng = random.Random(0)
+        for _ in range(20):
+            width, height = rng.randrange(60, 151), rng.randrange(60, 151)
+            row = [
+                rng.randrange(72) if rng.random() < 0.3 else 72
+                for _ in range(rng.randrange(1, 200))
+            ]
+            codes = bytearray(row * (width * height // len(row) + 1))
+            for _ in range(rng.choice((0, 5, 50, 500))):
+                codes[rng.randrange(width * height)] = rng.randrange(74)
+            test = cell_machine_levels.level.Level.from_codes(
+                width, height, bytes(codes[: width * height]), "", "effort", 0
+            )
+
+            level_codes = [test.save("V3", effort=effort) for effort in range(3)]
+            self.assertEqual(level_codes[0], test.save("V3"))
+            for level_code in level_codes:
+                self.assertEqual(cell_machine_levels.level.open(level_code), test)
+            self.assertLessEqual(len(level_codes[2]), len(level_codes[1]))
+            self.assertLessEqual(len(level_codes[1]), len(level_codes[0]))
+
+        self.assertEqual(
+            cell_machine_levels.level.transcode(test.save("V2"), "V3", effort=2),
+            level_codes[2],
+        )
+        self.assertRaises(ValueError, test.save, "V3", effort=3)
+
+    def test_transforms(self):
+        for backend in ("list", "packed", "sparse"):
+            # A clockwise spinner, a mover to the right and a placeable cell
+            test = cell_machine_levels.level.open(
+                "V1;3;2;2.1;1.0.0.0,3.0.1.0;transforms;0", backend=backend
+            )
+
+            rotated = test.rotated()
+            self.assertEqual(rotated.size, (2, 3))
+            self.assertEqual(rotated[0, 2, False], (1, 1))
+            self.assertEqual(rotated[0, 1, False], (3, 1))
+            self.assertTrue(rotated[1, 0, True])
+            self.assertEqual(rotated.rotated(-1), test)
+            self.assertEqual(test.rotated(2), rotated.rotated())
+
+            mirrored = test.mirrored()
+            self.assertEqual(
+                mirrored[2, 0, False], cell_machine_levels.level.CellEnum.spinner_left
+            )
+            self.assertEqual(mirrored[1, 0, False], (3, 2))
+            self.assertTrue(mirrored[0, 1, True])
+            self.assertEqual(test.mirrored(True), mirrored.rotated(2))
+
+            remapped = test.remapped(
+                {
+                    cell_machine_levels.level.CellEnum.mover: cell_machine_levels.level.CellEnum.bg,
+                    cell_machine_levels.level.CellEnum.bg: cell_machine_levels.level.CellEnum.trash,
+                }
+            )
+            self.assertEqual(
+                remapped[1, 0, False], cell_machine_levels.level.CellEnum.bg
+            )
+            self.assertEqual(
+                remapped[2, 1, False], cell_machine_levels.level.CellEnum.trash
+            )
+            self.assertEqual(remapped.backend, backend)
+
+            optimized = test.optimized()
+            self.assertEqual(optimized[0, 0, False], (1, 0))
+            self.assertEqual(test.rotated().optimized()[0, 2, False], (1, 0))
+            self.assertEqual(test.save("V1"), "V1;3;2;2.1;1.0.0.0,3.0.1.0;transforms;0")
+
+    def test_views(self):
+        prefab = cell_machine_levels.level.open("V1;2;2;0.0;3.0.0.0,5.0.1.1;;0")
+        for backend in ("list", "packed", "sparse"):
+            test = cell_machine_levels.level.Level(6, 4, "", "views", 0, backend)
+            test.save("V3")
+
+            view = test[1:5, 1:]
+            self.assertEqual(view.size, (4, 3))
+            view.fill(cell_machine_levels.level.Cell(6))
+            view[1:3, 0:2] = prefab
+            self.assertEqual(test[2, 1, False], (3, 0))
+            self.assertTrue(test[2, 1, True])
+            self.assertEqual(test[3, 2, False], cell_machine_levels.level.CellEnum.push)
+            self.assertEqual(
+                test[1, 1, False], cell_machine_levels.level.CellEnum.immobile
+            )
+            self.assertEqual(test[0, 1, False], cell_machine_levels.level.CellEnum.bg)
+            self.assertEqual(view[-1, -1, False], test[4, 3, False])
+
+            # Pasting a view of the same level, even one that overlaps it
+            test[0:4, 0:3] = test[2:6, 1:4]
+            self.assertEqual(test[0, 0, False], (3, 0))
+            self.assertEqual(test.save("V3"), test.clone().save("V3"))
+
+            cropped = test[0:2, 0:2].crop()
+            self.assertEqual(cropped.size, (2, 2))
+            self.assertEqual(cropped.to_codes(), test[0:2, 0:2].to_codes())
+            padded = cropped.cropped(-1, 0, 4, 3)
+            self.assertEqual(padded.size, (4, 3))
+            self.assertEqual(padded[1, 0, False], (3, 0))
+            self.assertEqual(padded[0, 2, False], cell_machine_levels.level.CellEnum.bg)
+
+            self.assertRaises(IndexError, view.blit, prefab, 3, 0)
+            self.assertRaises(
+                ValueError, test.__getitem__, (slice(0, 4, 2), slice(0, 2))
+            )
+
+    def test_profile(self):
+        cache = cell_machine_levels.cache.LevelCache()
+        with cell_machine_levels.instrument.Profile() as profile:
+            test = cache.open("V3;a;a;}{)08Y;;test;2")
+            cache.open("V3;a;a;}{)08Y;;test;2")
+            test.track_saves = True
+            test.save("V3")
+            test.save("V3")
+            with cell_machine_levels.instrument.Profile() as inner:
+                cell_machine_levels.level.transcode("V1;10;10;0.0;;test;2", "V2")
+        self.assertIsNone(cell_machine_levels.instrument.active)
+
+        self.assertEqual(profile.calls["V3 decode tokens"], 1)
+        self.assertEqual(profile.calls["V3 encode matches"], 1)
+        self.assertNotIn("V1 decode validate", profile.times)
+        self.assertEqual(profile.counts["bytes in"], 21)
+        self.assertEqual(profile.counts["cells decoded"], 100)
+        self.assertEqual(profile.counts["references decoded"], 1)
+        self.assertEqual(profile.counts["cache hits"], 1)
+        self.assertEqual(profile.counts["saves reused"], 1)
+        self.assertEqual(inner.calls["V1 decode validate"], 1)
+
+        # The level codes that aren't used aren't counted
+        with cell_machine_levels.instrument.Profile() as effort:
+            level_code = test.save("V3", effort=1)
+        self.assertEqual(effort.counts["bytes out"], len(level_code))
+        self.assertEqual(effort.counts["cells encoded"], 11)
+
+        profile.merge(pickle.loads(pickle.dumps(inner)))
+        self.assertEqual(profile.counts["bytes in"], 41)
+        self.assertIn("V2 encode runs", profile.report())
+
+        # Every thread counts in the same profile
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            for _ in range(4):
+                executor.submit(lambda: [profile.count("threads") for _ in range(1000)])
+        self.assertEqual(profile.counts["threads"], 4000)
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+            stderr
+        ), tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "levels.txt")
+            with open(path, "w") as file:
+                file.write("V3;a;a;}{)08Y;;test;2\n")
+            cell_machine_levels.__main__.main(
+                ["convert", "--to", "V2", "--profile", path]
+            )
+        self.assertIn("V3 decode tokens", stderr.getvalue())
+
 
 if __name__ == "__main__":
     unittest.main()